@@ -0,0 +1,337 @@
+"""
+qcloud_cos_py3 性能测试
+
+微基准测试签名、multipart 请求体构造和 URL 拼接；
+宏基准在子进程中启动 LocalCosServer，通过本机回环测试上传、分片上传、
+列目录和下载的吞吐量。每个宏基准在单独的子进程中运行，
+记录的峰值内存 (RSS) 只包含该项测试。
+结果以 JSON 输出，便于比较不同版本::
+
+    python benchmarks/bench_cos.py --output bench_results.json
+    python benchmarks/bench_cos.py --quick --only sign,multipart
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from io import BytesIO
+
+import aiohttp
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from qcloud_cos_py3 import CosBucket, AsyncCosBucket  # noqa: E402
+from qcloud_cos_py3.cos import MultipartEncoder  # noqa: E402
+from qcloud_cos_py3.local_server import LocalCosServer  # noqa: E402
+
+
+APP_ID = '1250000000'
+SECRET_ID = 'bench-secret-id'
+SECRET_KEY = 'bench-secret-key'
+BUCKET = 'bench'
+MB = 1024 * 1024
+SLICE_SIZES = (512 * 1024, MB, 2 * MB, 3 * MB)
+
+
+def peak_rss_mb():
+    usage = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux 上单位为 KB，macOS 上为字节
+    return usage / (MB if sys.platform == 'darwin' else 1024)
+
+
+def timeit(func, number, repeat=3):
+    """
+    :return: 最快一轮的每次耗时，单位为秒
+    """
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        for _ in range(number):
+            func()
+        best = min(best, (time.perf_counter() - start) / number)
+    return best
+
+
+def rate(count, seconds):
+    return round(count / seconds, 2) if seconds else None
+
+
+def _serve(conn):
+    server = LocalCosServer(APP_ID, SECRET_ID, SECRET_KEY, BUCKET)
+    server.start()
+    conn.send(server.endpoint)
+    conn.recv()
+    server.stop()
+
+
+class ServerProcess(object):
+    """
+    在子进程中运行模拟服务，避免服务端的内存计入客户端的峰值 RSS
+    """
+
+    def __enter__(self):
+        self._conn, child = multiprocessing.Pipe()
+        self._process = multiprocessing.Process(target=_serve, args=(child,),
+                                                daemon=True)
+        self._process.start()
+        self.endpoint = self._conn.recv()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._conn.send('stop')
+        self._process.join(5)
+
+
+def bucket(endpoint, **kwargs):
+    return CosBucket(APP_ID, SECRET_ID, SECRET_KEY, BUCKET,
+                     endpoint=endpoint, rate_limiter=False, **kwargs)
+
+
+def async_bucket(endpoint, **kwargs):
+    return AsyncCosBucket(APP_ID, SECRET_ID, SECRET_KEY, BUCKET,
+                          endpoint=endpoint, rate_limiter=False, **kwargs)
+
+
+def bench_sign(args):
+    cos = bucket(None, sign_cache=False)
+    number = 2000 if args.quick else 20000
+    app_sign = timeit(lambda: cos.signer.app_sign(
+        BUCKET, '/bench/dir/file.txt', 30), number)
+    sign_more = timeit(lambda: cos.signer.sign_more(BUCKET, '', 30), number)
+    cached = bucket(None)
+    cached_sign_more = timeit(
+        lambda: cached.signer.sign_more(BUCKET, '', 30), number
+    )
+    return {
+        'app_sign_per_sec': rate(1, app_sign),
+        'sign_more_per_sec': rate(1, sign_more),
+        'sign_more_cached_per_sec': rate(1, cached_sign_more),
+    }
+
+
+def bench_format_url(args):
+    cos = bucket(None)
+    number = 5000 if args.quick else 50000
+    seconds = timeit(lambda: cos._format_url(
+        '/files/v2/{app_id}/{bucket}/{file_path}?op=stat',
+        file_path='bench/dir/file.txt'
+    ), number)
+    return {'format_url_per_sec': rate(1, seconds)}
+
+
+def bench_multipart(args):
+    fields = {'op': 'upload', 'biz_attr': '', 'insertOnly': '0'}
+    results = {}
+    for size in (1024, MB):
+        content = os.urandom(size)
+        number = 20 if size == MB else 2000
+        if args.quick:
+            number //= 10
+
+        def encode():
+            b''.join(MultipartEncoder(fields, content))
+
+        seconds = timeit(encode, number)
+        key = 'encoder_%dkb' % (size // 1024)
+        results[key + '_per_sec'] = rate(1, seconds)
+        results[key + '_mb_per_sec'] = rate(size / MB, seconds)
+
+    def form_data():
+        form = aiohttp.FormData(fields)
+        form.add_field('filecontent', b'x' * 1024, filename='')
+        form()
+
+    # aiohttp 自带的 FormData 作为对照
+    results['aiohttp_form_data_1kb_per_sec'] = rate(1, timeit(form_data, 200))
+    return results
+
+
+def bench_small_upload(args, endpoint):
+    count = 200 if args.quick else 1000
+    concurrency = 16
+    content = b'x' * 1024
+    results = {'count': count, 'size': len(content),
+               'concurrency': concurrency}
+
+    with bucket(endpoint, pool_size=concurrency) as cos:
+        cos.create_folder('small')
+        start = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            list(executor.map(
+                lambda i: cos.upload_file(BytesIO(content), 'sync_%d' % i,
+                                          dir_name='small'),
+                range(count)
+            ))
+        results['sync_per_sec'] = rate(count, time.perf_counter() - start)
+
+    async def run():
+        async with async_bucket(endpoint, limit=concurrency) as cos:
+            semaphore = asyncio.Semaphore(concurrency)
+
+            async def upload(i):
+                async with semaphore:
+                    await cos.upload_file(BytesIO(content), 'async_%d' % i,
+                                          dir_name='small')
+
+            start = time.perf_counter()
+            await asyncio.gather(*[upload(i) for i in range(count)])
+            return time.perf_counter() - start
+
+    results['async_per_sec'] = rate(count, asyncio.run(run()))
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def bench_slice_upload(args, endpoint):
+    file_size = (8 if args.quick else 64) * MB
+    results = {'file_size': file_size}
+    with tempfile.TemporaryDirectory() as tmp_dir, \
+            bucket(endpoint, pool_size=4) as cos:
+        path = _random_file(tmp_dir, file_size)
+        for slice_size in SLICE_SIZES:
+            for workers in (1, 4):
+                start = time.perf_counter()
+                res = cos.upload_slice_file(path, slice_size, 'slice.bin',
+                                            dir_name='slice',
+                                            max_workers=workers)
+                seconds = time.perf_counter() - start
+                assert 'resource_path' in res, res
+                key = '%dkb_x%d_mb_per_sec' % (slice_size // 1024, workers)
+                results[key] = rate(file_size / MB, seconds)
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def bench_list(args, endpoint):
+    count = 500 if args.quick else 5000
+    results = {'entries': count}
+    with bucket(endpoint, pool_size=16) as cos:
+        with ThreadPoolExecutor(max_workers=16) as executor:
+            list(executor.map(
+                lambda i: cos.upload_file(BytesIO(b''), '%06d' % i,
+                                          dir_name='list'),
+                range(count)
+            ))
+        for page_size in (100, 1000):
+            start = time.perf_counter()
+            listed = sum(1 for _ in cos.iter_folder('list',
+                                                    page_size=page_size))
+            seconds = time.perf_counter() - start
+            assert listed == count, listed
+            results['page_%d_entries_per_sec' % page_size] = \
+                rate(count, seconds)
+            results['page_%d_pages_per_sec' % page_size] = \
+                rate(-(-count // page_size), seconds)
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def bench_download(args, endpoint):
+    file_size = (8 if args.quick else 64) * MB
+    results = {'file_size': file_size}
+    with bucket(endpoint, pool_size=4) as cos, \
+            tempfile.TemporaryDirectory() as tmp_dir:
+        cos.upload_slice_file(_random_file(tmp_dir, file_size), MB,
+                              'download.bin', dir_name='download',
+                              max_workers=4)
+        local_path = os.path.join(tmp_dir, 'out.bin')
+
+        start = time.perf_counter()
+        cos.download_to_file('download/download.bin', local_path)
+        results['stream_mb_per_sec'] = rate(file_size / MB,
+                                            time.perf_counter() - start)
+        results['stream_peak_rss_mb'] = peak_rss_mb()
+
+        start = time.perf_counter()
+        cos.download_to_file('download/download.bin', local_path,
+                             max_workers=4, part_size=4 * MB)
+        results['parallel_x4_mb_per_sec'] = rate(file_size / MB,
+                                                 time.perf_counter() - start)
+
+        start = time.perf_counter()
+        content = cos.get_file('download/download.bin')
+        results['get_file_mb_per_sec'] = rate(len(content) / MB,
+                                              time.perf_counter() - start)
+        del content
+    results['peak_rss_mb'] = peak_rss_mb()
+    return results
+
+
+def _random_file(dir_path, size):
+    path = os.path.join(dir_path, 'source.bin')
+    with open(path, 'wb') as f:
+        for _ in range(size // MB):
+            f.write(os.urandom(MB))
+    return path
+
+
+def run_isolated(name, args, endpoint):
+    """
+    在新启动的解释器中运行宏基准，峰值 RSS 不受之前的测试影响
+    """
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=1, mp_context=context) as executor:
+        return executor.submit(MACRO[name], args, endpoint).result()
+
+
+MICRO = {
+    'sign': bench_sign,
+    'format_url': bench_format_url,
+    'multipart': bench_multipart,
+}
+
+MACRO = {
+    'small_upload': bench_small_upload,
+    'slice_upload': bench_slice_upload,
+    'list': bench_list,
+    'download': bench_download,
+}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[1])
+    parser.add_argument('--output', help='结果 JSON 文件，默认输出到标准输出')
+    parser.add_argument('--quick', action='store_true',
+                        help='减少数据量，快速跑一遍')
+    parser.add_argument('--only', help='只运行指定的测试，逗号分隔：'
+                        + ','.join(list(MICRO) + list(MACRO)))
+    args = parser.parse_args()
+    only = set(args.only.split(',')) if args.only else None
+
+    results = {}
+    for name, func in MICRO.items():
+        if only is None or name in only:
+            results[name] = func(args)
+
+    macro = [name for name in MACRO if only is None or name in only]
+    if macro:
+        with ServerProcess() as server:
+            for name in macro:
+                results[name] = run_isolated(name, args, server.endpoint)
+
+    report = {
+        'meta': {
+            'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+            'quick': args.quick,
+        },
+        'results': results,
+    }
+    output = json.dumps(report, indent=2, sort_keys=True)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(output + '\n')
+    else:
+        print(output)
+
+
+if __name__ == '__main__':
+    main()
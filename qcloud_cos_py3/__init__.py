@@ -1 +1,6 @@
-from .cos import CosBucket
+from .cos import (
+    CosBucket, AsyncCosBucket, BatchResult, SliceCheckpoint, MultipartEncoder
+)
+from .ratelimit import RateLimiter, AsyncRateLimiter
+from .metrics import Observer, MetricsAggregator, RequestEvent
+from .transfer import TransferConfig
@@ -0,0 +1,110 @@
+import threading
+import time
+from collections import OrderedDict
+
+
+def normalize_path(path):
+    return '/'.join(p for p in str(path).split('/') if p)
+
+
+def _ancestors(path):
+    parts = path.split('/') if path else []
+    return ['/'.join(parts[:i]) for i in range(len(parts), -1, -1)]
+
+
+class MetaCache(object):
+    """
+    带过期时间的 LRU 元数据缓存，用于 stat_file / stat_folder / list_folder
+
+    缓存项以 ``(类型, 路径, ...)`` 为键，按路径建立索引，
+    写操作后调用 :meth:`invalidate` 清除该路径及其所有上级目录的缓存。
+    读取前用 :meth:`generation` 记下路径的版本，:meth:`set` 时版本已变，
+    说明读取期间路径被写过，结果可能是旧的，不放入缓存
+
+    :param maxsize: 最大缓存项数
+    :param ttl: 缓存有效期，单位为秒
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._data = OrderedDict()
+        self._index = {}
+        self._generations = {}
+        self._epoch = 0
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def get(self, key):
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > time.monotonic():
+                self._data.move_to_end(key)
+                self.hits += 1
+                return item[1]
+            if item is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+
+    def generation(self, path):
+        """
+        :return: 路径当前的版本，传给 :meth:`set`
+        """
+        with self._lock:
+            return self._epoch, self._generations.get(path, 0)
+
+    def set(self, key, value, generation=None):
+        """
+        :param generation: 读取前 :meth:`generation` 的返回值（可选），
+          与当前版本不同时不缓存
+        """
+        with self._lock:
+            if generation is not None and generation != (
+                    self._epoch, self._generations.get(key[1], 0)):
+                return
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (time.monotonic() + self.ttl, value)
+            self._index.setdefault(key[1], set()).add(key)
+            while len(self._data) > self.maxsize:
+                self._remove(next(iter(self._data)))
+
+    def _remove(self, key):
+        del self._data[key]
+        keys = self._index[key[1]]
+        keys.discard(key)
+        if not keys:
+            del self._index[key[1]]
+
+    def invalidate(self, path):
+        """
+        清除路径本身及其所有上级目录的缓存
+        """
+        with self._lock:
+            if len(self._generations) >= self.maxsize * 4:
+                # 版本表过大时整体换代，读取中的结果都不再缓存
+                self._generations.clear()
+                self._epoch += 1
+            for p in _ancestors(normalize_path(path)):
+                self._generations[p] = self._generations.get(p, 0) + 1
+                for key in list(self._index.get(p, ())):
+                    self._remove(key)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._index.clear()
+            self._generations.clear()
+            self._epoch += 1
+
+    def stats(self):
+        """
+        :return: ``{'hits': 命中次数, 'misses': 未命中次数, 'size': 缓存项数}``
+        """
+        return {'hits': self.hits, 'misses': self.misses,
+                'size': len(self._data)}
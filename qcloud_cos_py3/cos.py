@@ -1,81 +1,2153 @@
 import os
+import json
+import hashlib
+import mmap
+import asyncio
+import tempfile
+import uuid
+import queue
+import threading
 import aiohttp
 import time
-import random
-from aiohttp import MultipartWriter
-from aiohttp.hdrs import CONTENT_DISPOSITION, CONTENT_TYPE
-from aiohttp.payload import StringPayload, BytesPayload
+from concurrent.futures import (
+    ThreadPoolExecutor, as_completed, wait, FIRST_COMPLETED
+)
+from aiohttp.payload import Payload
 from collections import namedtuple
+from contextlib import contextmanager
 import requests
+from requests.adapters import HTTPAdapter
 from io import BytesIO
 
-from .cos_auth import CosAuth
+from .cos_auth import CosAuth, take_sign_time, add_sign_time
+from .cache import MetaCache, normalize_path
+from .ratelimit import RateLimiter, AsyncRateLimiter, THROTTLE_CODES
+from .retry import (
+    OPERATIONS, DEFAULT_RETRY_BUDGET, backoff, is_retryable, merge_timeouts
+)
+from .hedge import (
+    LatencyTracker, hedged_call, async_hedged_call, timed, async_timed
+)
+from .singleflight import SingleFlight, AsyncSingleFlight
+from .metrics import RequestProbe
+from .transfer import TransferConfig, ThroughputTracker, plan_transfer
+
+
+CosConfig = namedtuple(
+    'CosConfig',
+    ['app_id', 'secret_id', 'secret_key', 'region', 'bucket']
+)
+
+BatchResult = namedtuple('BatchResult', ['item', 'ok', 'code', 'error'])
+
+MAX_RETRY = 3
+# 从第一次被限流起最多重试的时间，单位为秒
+MAX_THROTTLE_TIME = 20
+THROTTLE_BACKOFF_BASE = 0.5
+DEFAULT_POOL_SIZE = 10
+DEFAULT_CONN_LIMIT = 100
+SIGN_EXPIRE = 30
+DOWNLOAD_CHUNK_SIZE = 64 * 1024
+DOWNLOAD_PART_SIZE = 8 * 1024 * 1024
+UPLOAD_CHUNK_SIZE = 64 * 1024
+LIST_PREFETCH = 2
+WALK_WORKERS = 8
+SYNC_WORKERS = 4
+SLICE_THRESHOLD = 20 * 1024 * 1024
+SLICE_SIZE = 1048576
+META_CACHE_TTL = 10
+DEFAULT_ENDPOINT = 'http://{region}.file.myqcloud.com'
+
+
+class MultipartEncoder(object):
+    """
+    流式构造 COS 接受的 multipart/form-data 请求体
+
+    先输出表单字段，再按块读取文件内容，不会在内存中拼接完整的请求体。
+    Content-Type 中的 boundary 不带引号，COS 不支持带引号的 boundary。
+    可直接作为 requests 的 ``data`` 参数，异步请求使用 :func:`_build_form`
+
+    :param fields: 表单字段
+    :param filecontent: 文件内容（可选），可以是 bytes、memoryview 或类文件对象
+    :param mime: 文件类型（可选）
+    :param chunk_size: 读取文件的块大小（可选），默认为 64 KB
+    :param size: 文件内容的长度（可选），用于无法 seek 的流，如网络响应
+    """
+
+    def __init__(self, fields, filecontent=None, *,
+                 mime='application/octet-stream',
+                 chunk_size=UPLOAD_CHUNK_SIZE, size=None):
+        self.boundary = uuid.uuid4().hex
+        self.content_type = 'multipart/form-data; boundary=' + self.boundary
+        self.chunk_size = chunk_size
+        delimiter = ('--' + self.boundary + '\r\n').encode('utf-8')
+        head = b''.join(
+            delimiter +
+            ('Content-Disposition: form-data; name="%s"\r\n\r\n' % name
+             ).encode('utf-8') +
+            str(value).encode('utf-8') + b'\r\n'
+            for name, value in fields.items()
+        )
+        self._tail = ('--' + self.boundary + '--\r\n').encode('utf-8')
+        self._stream = None
+        self._content = None
+        self._start = None
+        if filecontent is None:
+            size = 0
+        else:
+            head += delimiter + (
+                'Content-Disposition: form-data; name="filecontent"; '
+                'filename=""\r\nContent-Type: %s\r\n\r\n' % mime
+            ).encode('utf-8')
+            self._tail = b'\r\n' + self._tail
+            if isinstance(filecontent, (bytes, bytearray, memoryview)):
+                self._content = memoryview(filecontent)
+                size = self._content.nbytes
+            else:
+                self._stream = filecontent
+                stream_size = self._stream_size(filecontent)
+                if size is None:
+                    size = stream_size
+        self._head = head
+        self.len = None if size is None else \
+            len(self._head) + size + len(self._tail)
+        self._reader = None
+        self._buffer = b''
+
+    def _stream_size(self, stream):
+        try:
+            self._start = stream.tell()
+            stream.seek(0, os.SEEK_END)
+            size = stream.tell() - self._start
+            stream.seek(self._start)
+            return size
+        except (AttributeError, OSError, ValueError):
+            self._start = None
+            return None
+
+    @property
+    def rewindable(self):
+        """
+        请求体能否重新发送，流无法 seek 时重试会发出不完整的内容
+        """
+        return self._stream is None or self._start is not None
+
+    def __iter__(self):
+        self.rewind()
+        return self._chunks()
+
+    def _chunks(self):
+        yield self._head
+        if self._content is not None:
+            for i in range(0, self._content.nbytes, self.chunk_size):
+                yield self._content[i:i + self.chunk_size]
+        elif self._stream is not None:
+            while True:
+                chunk = self._stream.read(self.chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+        yield self._tail
+
+    async def _async_chunks(self):
+        # 文件内容的 read 可以是协程，如 :class:`_AsyncSourceReader`
+        self.rewind()
+        yield self._head
+        if self._content is not None:
+            for i in range(0, self._content.nbytes, self.chunk_size):
+                yield self._content[i:i + self.chunk_size]
+        elif self._stream is not None:
+            while True:
+                chunk = self._stream.read(self.chunk_size)
+                if asyncio.iscoroutine(chunk):
+                    chunk = await chunk
+                if not chunk:
+                    break
+                yield chunk
+        yield self._tail
+
+    def rewind(self):
+        """
+        回到请求体开头，用于重试
+        """
+        if self._start is not None:
+            self._stream.seek(self._start)
+        self._reader = None
+        self._buffer = b''
+
+    def read(self, size=-1):
+        """
+        读取请求体。内容只在一个块内时返回 memoryview，不复制文件内容
+        """
+        if self._reader is None:
+            self._reader = self._chunks()
+        parts = []
+        length = 0
+        while size < 0 or length < size:
+            if not self._buffer:
+                chunk = next(self._reader, None)
+                if chunk is None:
+                    break
+                self._buffer = memoryview(chunk)
+            if size < 0:
+                part, self._buffer = self._buffer, b''
+            else:
+                part = self._buffer[:size - length]
+                self._buffer = self._buffer[len(part):]
+            parts.append(part)
+            length += len(part)
+        if len(parts) == 1:
+            return parts[0]
+        return b''.join(parts)
+
+
+class _MultipartPayload(Payload):
+    """
+    把 :class:`MultipartEncoder` 包装成 aiohttp 的 payload
+    """
+
+    def __init__(self, encoder):
+        super().__init__(encoder, content_type=encoder.content_type)
+        self._size = encoder.len
+
+    def decode(self, encoding='utf-8', errors='strict'):
+        raise TypeError('Streaming multipart payload can not be decoded')
+
+    async def write(self, writer):
+        async for chunk in self._value._async_chunks():
+            await writer.write(chunk)
+
+
+def _build_form(fields, filecontent=None, mime='application/octet-stream',
+                size=None):
+    """
+    构造异步请求使用的 multipart/form-data 请求体
+
+    :param fields: 表单字段
+    :param filecontent: 文件内容（可选）
+    :param mime: 文件类型（可选）
+    :param size: 文件内容的长度（可选），同 :class:`MultipartEncoder`
+    """
+    return _MultipartPayload(
+        MultipartEncoder(fields, filecontent, mime=mime, size=size)
+    )
+
+
+class _SourceReader(object):
+    """
+    把源站响应包装成类文件对象，供边下载边上传使用
+
+    ``read(size)`` 读满 size 字节才返回，除非已到结尾。
+    收到的内容超过 max_size，或少于源站声明的长度时抛出异常，
+    异常同时记录在 ``error`` 中，用于区分抓取失败和上传失败
+
+    :param chunks: 响应内容的迭代器
+    :param size: 源站声明的长度，未知时为 None
+    :param max_size: 大小上限，None 表示不限制
+    """
+
+    def __init__(self, chunks, size, max_size):
+        self._chunks = chunks
+        self.size = size
+        self.max_size = max_size
+        self.received = 0
+        self.error = None
+        self._buffer = bytearray()
+
+    @property
+    def too_large(self):
+        return self.max_size is not None and self.received > self.max_size
+
+    def _feed(self, chunk):
+        if chunk is None:
+            if self.size is not None and self.received < self.size:
+                raise ValueError('source ended at %d of %d bytes'
+                                 % (self.received, self.size))
+            return False
+        self.received += len(chunk)
+        if self.too_large:
+            raise ValueError('source exceeds %d bytes' % self.max_size)
+        self._buffer += chunk
+        return True
+
+    def _take(self, size):
+        if size < 0 or size >= len(self._buffer):
+            data = bytes(self._buffer)
+            self._buffer.clear()
+        else:
+            data = bytes(self._buffer[:size])
+            del self._buffer[:size]
+        return data
+
+    def read(self, size=-1):
+        try:
+            while size < 0 or len(self._buffer) < size:
+                if not self._feed(next(self._chunks, None)):
+                    break
+        except Exception as e:
+            self.error = e
+            raise
+        return self._take(size)
+
+
+class _AsyncSourceReader(_SourceReader):
+    """
+    asyncio 版本的 :class:`_SourceReader`，chunks 为异步迭代器
+    """
+
+    async def read(self, size=-1):
+        try:
+            while size < 0 or len(self._buffer) < size:
+                try:
+                    chunk = await self._chunks.__anext__()
+                except StopAsyncIteration:
+                    chunk = None
+                if not self._feed(chunk):
+                    break
+        except Exception as e:
+            self.error = e
+            raise
+        return self._take(size)
+
+
+def _fetch_error(reader):
+    if reader.too_large:
+        return {'error': 'file too large'}
+    return {'error': 'download file failed'}
+
+
+def _source_size(source):
+    """
+    :return: 本地文件、bytes 或可 seek 的流从当前位置到结尾的长度，
+      无法获取时返回 None
+    """
+    if isinstance(source, (str, os.PathLike)):
+        return os.path.getsize(source)
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return memoryview(source).nbytes
+    try:
+        if asyncio.iscoroutinefunction(source.tell):
+            return None
+        start = source.tell()
+        source.seek(0, os.SEEK_END)
+        size = source.tell() - start
+        source.seek(start)
+        return size
+    except (AttributeError, OSError, ValueError):
+        return None
+
+
+def _put_succeeded(res):
+    return 'error' not in res and res.get('code', 0) == 0
+
+
+def _file_sha1(file_path, chunk_size=DOWNLOAD_PART_SIZE):
+    sha1 = hashlib.sha1()
+    with open(file_path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _stream_sha1(stream, chunk_size=DOWNLOAD_PART_SIZE):
+    """
+    计算 bytes 或可 seek 的流从当前位置到结尾的 SHA1，完成后回到原位置
+    """
+    if isinstance(stream, (bytes, bytearray, memoryview)):
+        return hashlib.sha1(stream).hexdigest()
+    start = stream.tell()
+    sha1 = hashlib.sha1()
+    for chunk in iter(lambda: stream.read(chunk_size), b''):
+        sha1.update(chunk)
+    stream.seek(start)
+    return sha1.hexdigest()
+
+
+@contextmanager
+def _mapped_file(file_path):
+    """
+    只读映射本地文件，返回整个文件的 memoryview，分片直接切片，不复制内容
+    """
+    with open(file_path, 'rb') as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            # 空文件无法映射
+            yield memoryview(b'')
+            return
+        mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    view = memoryview(mapped)
+    try:
+        yield view
+    finally:
+        view.release()
+        try:
+            mapped.close()
+        except BufferError:
+            # 还有分片的 memoryview 被引用（如异常的 traceback），交给垃圾回收
+            pass
+
+
+class _PrefixSha1(object):
+    """
+    按顺序计算文件从头开始的 SHA1，与分片上传在同一遍读取中完成
+
+    :param view: 文件内容
+    """
+
+    def __init__(self, view):
+        self._view = view
+        self._sha1 = hashlib.sha1()
+        self._pos = 0
+
+    def update_to(self, end):
+        if end > self._pos:
+            self._sha1.update(self._view[self._pos:end])
+            self._pos = end
+
+    def hexdigest(self):
+        self.update_to(len(self._view))
+        return self._sha1.hexdigest()
+
+
+@contextmanager
+def _atomic_path(local_path):
+    """
+    在目标文件所在目录生成临时文件，成功后重命名为目标文件，失败则删除
+
+    临时文件按 umask 设置权限，与直接用 open 创建的文件相同
+    """
+    dir_name = os.path.dirname(os.path.abspath(local_path))
+    tmp_path = os.path.join(dir_name, '.%s.%s.tmp' % (
+        os.path.basename(local_path), uuid.uuid4().hex))
+    os.close(os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o666))
+    try:
+        yield tmp_path
+        os.replace(tmp_path, local_path)
+    except BaseException:
+        os.remove(tmp_path)
+        raise
+
+
+def _split_ranges(file_size, part_size):
+    return [(start, min(start + part_size, file_size) - 1)
+            for start in range(0, file_size, part_size)]
+
+
+class SliceCheckpoint(object):
+    """
+    分片上传的断点记录，以追加写入的日志形式保存在本地文件中
+
+    第一行是 JSON 格式的头部，记录上传会话、是否只能串行上传、目标地址、
+    本地文件大小和修改时间、分片大小；之后每行是一个已完成的分片位移。
+    读取时合并为只有头部和已完成位移的新文件。本地文件变化后记录自动失效。
+    """
+
+    def __init__(self, path, url, file_size, mtime, slice_size):
+        self.path = path
+        self.url = url
+        self.file_size = file_size
+        self.mtime = mtime
+        self.slice_size = slice_size
+        self.session = None
+        self.serial_upload = False
+        self.done = set()
+
+    @classmethod
+    def load(cls, path, url, real_file_path, slice_size):
+        """
+        读取断点记录，记录不存在或与本地文件不匹配时返回空记录
+        """
+        st = os.stat(real_file_path)
+        checkpoint = cls(path, url, st.st_size, st.st_mtime, slice_size)
+        try:
+            with open(path) as f:
+                header = json.loads(f.readline())
+                # 中断时最后一行可能没有写完整，只取以换行结尾的行
+                lines = f.read().split('\n')[:-1]
+        except (OSError, ValueError):
+            return checkpoint
+        if (header.get('url'), header.get('file_size'), header.get('mtime'),
+                header.get('slice_size')) == (url, st.st_size, st.st_mtime,
+                                              slice_size):
+            checkpoint.session = header.get('session')
+            checkpoint.serial_upload = bool(header.get('serial_upload'))
+            checkpoint.done = {int(line) for line in lines if line.isdigit()}
+            checkpoint.save()
+        return checkpoint
+
+    def save(self):
+        """
+        重写整个记录文件
+        """
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump({
+                'session': self.session,
+                'serial_upload': self.serial_upload,
+                'url': self.url,
+                'file_size': self.file_size,
+                'mtime': self.mtime,
+                'slice_size': self.slice_size,
+            }, f)
+            f.write('\n')
+            f.writelines('%d\n' % offset for offset in sorted(self.done))
+        os.replace(tmp_path, self.path)
+
+    def add(self, offset):
+        """
+        追加一个已完成的分片位移，不重写已有记录
+        """
+        self.done.add(offset)
+        with open(self.path, 'a') as f:
+            f.write('%d\n' % offset)
+
+    def remove(self):
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class _BaseCosBucket(object):
+
+    def __init__(self, app_id, secret_id, secret_key, bucket_name, region,
+                 sign_expire, sign_cache, rate_limiter, timeouts,
+                 retry_budget, hedge_delay, max_hedges, observers, endpoint,
+                 transfer_config):
+        self.config = CosConfig(app_id, secret_id, secret_key, region, bucket_name)
+        self.endpoint = (endpoint or DEFAULT_ENDPOINT).rstrip('/')
+        self.signer = CosAuth(self.config, cache=sign_cache)
+        self.sign_expire = sign_expire
+        self.rate_limiter = rate_limiter
+        self.timeouts = merge_timeouts(timeouts)
+        if retry_budget is None:
+            retry_budget = DEFAULT_RETRY_BUDGET
+        self.retry_budget = retry_budget
+        self.hedge_delay = hedge_delay
+        self.max_hedges = max_hedges
+        self.latency = LatencyTracker()
+        self.meta_cache = None
+        self.flights = None
+        self.observers = list(observers)
+        self.transfer_config = transfer_config or TransferConfig()
+        self.throughput = ThroughputTracker()
+
+    @contextmanager
+    def _observing(self, op):
+        """
+        收集一次 API 调用的统计，结束时通知所有观察者
+        """
+        probe = RequestProbe(op, take_sign_time())
+        cancelled = False
+        try:
+            yield probe
+        except GeneratorExit:
+            # 流式下载提前结束不算失败
+            raise
+        except asyncio.CancelledError:
+            # 落后的对冲请求被取消，只统计胜出的请求
+            cancelled = True
+            raise
+        except BaseException as e:
+            probe.error = e
+            raise
+        finally:
+            if self.observers and not cancelled:
+                event = probe.event()
+                for observer in self.observers:
+                    try:
+                        observer.on_request(event)
+                    except Exception:
+                        pass
+
+    @contextmanager
+    def _invalidating(self, *paths):
+        try:
+            yield
+        finally:
+            for path in paths:
+                if self.meta_cache is not None:
+                    self.meta_cache.invalidate(path)
+                if self.flights is not None:
+                    self.flights.forget(path)
+
+    def _hedge_delay(self, op):
+        if self.hedge_delay == 'auto':
+            return self.latency.delay(op)
+        return self.hedge_delay
+
+    def _op_policy(self, op, idempotent):
+        """
+        :return: ``(超时配置, 是否幂等, 截止时间)``
+        """
+        kind, op_idempotent = OPERATIONS[op]
+        if idempotent is None:
+            idempotent = op_idempotent
+        timeout = self.timeouts[kind]
+        deadline = None
+        if timeout.deadline is not None:
+            deadline = time.monotonic() + timeout.deadline
+        return timeout, idempotent, deadline
+
+    @staticmethod
+    def _read_timeout(timeout, deadline):
+        if deadline is None:
+            return timeout.read
+        return max(min(timeout.read, deadline - time.monotonic()), 0.001)
+
+    def _retry_delay(self, retries, deadline):
+        """
+        第 retries 次重试前需要等待的时间。
+        超过截止时间或重试预算耗尽时返回 None，不再重试
+        """
+        if retries >= MAX_RETRY:
+            return None
+        delay = backoff(retries - 1)
+        if deadline is not None and time.monotonic() + delay >= deadline:
+            return None
+        if not self.retry_budget.withdraw():
+            return None
+        return delay
+
+    @staticmethod
+    def _throttle_delay(throttles, throttled_at, deadline):
+        """
+        第 throttles 次被限流后重试前需要等待的时间，按指数退避并随机抖动。
+        从第一次被限流起超过 :data:`MAX_THROTTLE_TIME` 秒或超过截止时间时
+        返回 None，不再重试
+        """
+        delay = backoff(throttles, base=THROTTLE_BACKOFF_BASE)
+        retry_at = time.monotonic() + delay
+        if retry_at >= throttled_at + MAX_THROTTLE_TIME:
+            return None
+        if deadline is not None and retry_at >= deadline:
+            return None
+        return delay
+
+    def _download_timeout(self):
+        timeout = self.timeouts[OPERATIONS['get_file'][0]]
+        return timeout.connect, timeout.read
+
+    @staticmethod
+    def _rate_dir(method, url):
+        # 只有写操作受单目录写入速率限制
+        if method != 'post':
+            return None
+        path = url.split('?', 1)[0].split('/files/v2/', 1)[-1]
+        return normalize_path(path.split('/', 2)[-1]).rpartition('/')[0]
+
+    def _format_url(self, url_pattern, **extra):
+        url_pattern = self.endpoint + url_pattern
+        return url_pattern.format(**self.config._asdict(), **extra)
+
+    def _list_url(self, dir_name, prefix, num, context):
+        url = self._format_url("/files/v2/{app_id}/{bucket}/")
+        if dir_name:
+            url += str(dir_name) + "/"
+        if prefix:
+            url += str(prefix)
+
+        url += "?op=list&num=" + str(num)
+        if context is not None:
+            url += '&context=' + str(context)
+        return url
+
+    def _sign_more(self):
+        """
+        整个 bucket 可用的多次签名
+        """
+        return self.signer.sign_more(self.config.bucket, '', self.sign_expire)
+
+    def _download_req(self, file_path):
+        url = self._format_url(
+            '/files/v2/{app_id}/{bucket}/' + file_path
+        )
+        headers = {
+            'Authorization': self.signer.sign_download(
+                self.config.bucket, file_path, self.sign_expire
+            )
+        }
+        return url, headers
+
+    @staticmethod
+    def _dest_path(source_file_path, dest_file_path):
+        # 目标路径若不以 / 开头，则认为是相对于源文件所在目录的路径
+        if dest_file_path.startswith('/'):
+            return dest_file_path
+        return normalize_path(source_file_path).rpartition('/')[0] + '/' + \
+            dest_file_path
+
+    def _upload_url(self, upload_filename, dir_name):
+        url = self._format_url('/files/v2/{app_id}/{bucket}')
+        if dir_name is not None:
+            url += '/' + dir_name
+        url += '/' + upload_filename
+        return url
+
+    @staticmethod
+    def _remote_sha(res, size):
+        """
+        :param res: stat_file 的结果
+        :return: 远端文件存在且大小为 size 时返回其 SHA1，否则返回 None
+        """
+        if res.get('code') != 0:
+            return None
+        data = res['data']
+        if data.get('filesize') != size:
+            return None
+        return (data.get('sha') or '').lower() or None
+
+    @staticmethod
+    def _check_sha(file_path, sha, res):
+        """
+        比较本地计算的 SHA1 与上传后 stat_file 返回的 SHA1，不区分大小写
+
+        :param res: stat_file 的结果
+        """
+        remote = res.get('data', {}).get('sha')
+        if (remote or '').lower() != sha.lower():
+            raise Exception('SHA1 mismatch after uploading %s: local %s, '
+                            'remote %s' % (file_path, sha, remote))
+
+    @staticmethod
+    def _seekable_size(file_stream):
+        size = _source_size(file_stream)
+        if size is None:
+            raise ValueError('if_changed requires bytes or a seekable stream')
+        return size
+
+
+class CosBucket(_BaseCosBucket):
+    """
+    COS bucket 客户端
+
+    所有同步请求共用一个 ``requests.Session`` 连接池，
+    可用 ``with CosBucket(...) as bucket:`` 在结束时关闭连接池
+
+    同一个对象可以在多个线程间共用：每次调用的状态只保存在局部变量中，
+    签名缓存、元数据缓存、限速器等共享状态都有锁保护。
+    ``pool_size`` 应不小于同时发请求的线程数，包括 upload_slice_file、
+    download_to_file 等方法内部的 ``max_workers``，
+    否则超出的连接用完即关闭，无法复用
+
+    :param pool_size: 连接池大小（可选），默认为 10，
+      即最多 10 个线程同时复用连接
+    :param keep_alive: 是否保持长连接（可选），默认为 True
+    :param sign_expire: 多次签名的有效期，单位为秒（可选），默认为 30 秒
+    :param sign_cache: 是否缓存多次签名（可选），默认为 True
+    :param meta_cache_size: 元数据缓存的最大项数（可选），默认为 0，即不缓存。
+      开启后缓存 stat_file、stat_folder、list_folder 的成功结果，
+      通过本对象对相关路径的写操作会自动清除缓存；
+      命中率见 ``meta_cache.stats()``
+    :param meta_cache_ttl: 元数据缓存的有效期，单位为秒（可选），默认为 10 秒
+    :param rate_limiter: 限速器（可选），默认为新建的
+      :class:`~qcloud_cos_py3.ratelimit.RateLimiter`，可在多个对象间共用；
+      传入 False 则不限速。无论是否限速，被限流时都按指数退避随机等待后重试，
+      从第一次被限流起最多重试 20 秒
+    :param timeouts: 各类操作的超时配置（可选），
+      ``{类别: OpTimeout(连接超时, 读超时, 截止时间)}``，
+      类别为 read、write、upload、download，未指定的类别使用
+      :data:`~qcloud_cos_py3.retry.DEFAULT_TIMEOUTS`。
+      截止时间限制一次调用包括所有重试在内的总耗时，None 表示不限制
+    :param retry_budget: 重试预算（可选），默认为进程内共用的
+      :data:`~qcloud_cos_py3.retry.DEFAULT_RETRY_BUDGET`
+    :param hedge_delay: 对冲请求的等待时间，单位为秒（可选），默认为 None，
+      即不对冲。get_file、stat_file、list_folder 超过该时间未返回时，
+      再发一个相同的请求，取最先返回的结果；写操作从不对冲。
+      第一个请求和对冲请求分别在两个线程池中执行，对冲请求不会排在
+      其他调用的第一个请求后面
+      传入 ``'auto'`` 则取该操作最近耗时的 p95
+    :param max_hedges: 每次调用最多额外发出的对冲请求数（可选），默认为 1
+    :param single_flight: 是否合并相同的并发读请求（可选），默认为 False。
+      开启后同时对同一路径的 get_file、stat_file 只发出一个请求，
+      所有调用共享其结果；通过本对象写入该路径后发起的读请求不会复用之前的请求
+    :param observers: 请求观察者列表（可选），每次 API 调用结束时收到一个
+      :class:`~qcloud_cos_py3.metrics.RequestEvent`，
+      如 :class:`~qcloud_cos_py3.metrics.MetricsAggregator`
+    :param endpoint: 服务地址（可选），默认为 ``http://{region}.file.myqcloud.com``，
+      可指向 :class:`~qcloud_cos_py3.local_server.LocalCosServer` 等兼容服务
+    :param transfer_config: :meth:`put` 选择上传方式的阈值（可选），
+      见 :class:`~qcloud_cos_py3.transfer.TransferConfig`
+    """
+
+    def __init__(self, app_id, secret_id, secret_key, bucket_name, region='sh',
+                 *, pool_size=DEFAULT_POOL_SIZE, keep_alive=True,
+                 sign_expire=SIGN_EXPIRE, sign_cache=True, meta_cache_size=0,
+                 meta_cache_ttl=META_CACHE_TTL, rate_limiter=None,
+                 timeouts=None, retry_budget=None, hedge_delay=None,
+                 max_hedges=1, single_flight=False, observers=(),
+                 endpoint=None, transfer_config=None):
+        if rate_limiter is None:
+            rate_limiter = RateLimiter()
+        super().__init__(app_id, secret_id, secret_key, bucket_name, region,
+                         sign_expire, sign_cache, rate_limiter, timeouts,
+                         retry_budget, hedge_delay, max_hedges, observers,
+                         endpoint, transfer_config)
+        self.headers = {'Content-Type': 'application/json'}
+        self.session = self._create_session(pool_size, keep_alive)
+        if single_flight:
+            self.flights = SingleFlight()
+        if meta_cache_size:
+            self.meta_cache = MetaCache(meta_cache_size, meta_cache_ttl)
+        self._pool_size = pool_size
+        self._primary_executor = None
+        self._hedge_executor = None
+        self._hedge_lock = threading.Lock()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @staticmethod
+    def _create_session(pool_size, keep_alive):
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size,
+                              pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        if not keep_alive:
+            session.headers['Connection'] = 'close'
+        return session
+
+    def close(self):
+        """
+        关闭连接池
+        """
+        self.session.close()
+        if self._hedge_executor is not None:
+            self._primary_executor.shutdown(wait=False)
+            self._hedge_executor.shutdown(wait=False)
+            self._primary_executor = self._hedge_executor = None
+
+    def _hedged(self, op, fetch):
+        if self.hedge_delay is None:
+            return fetch()
+        fetch = timed(self.latency, op, fetch)
+        delay = self._hedge_delay(op)
+        if delay is None:
+            return fetch()
+        with self._hedge_lock:
+            if self._hedge_executor is None:
+                self._primary_executor = ThreadPoolExecutor(
+                    max_workers=self._pool_size
+                )
+                self._hedge_executor = ThreadPoolExecutor(
+                    max_workers=self._pool_size * self.max_hedges
+                )
+            primary, hedges = self._primary_executor, self._hedge_executor
+        return hedged_call(primary, self._carry_sign_time(fetch), delay,
+                           self.max_hedges, hedges)
+
+    @staticmethod
+    def _carry_sign_time(fetch):
+        # 把调用方线程的签名耗时交给第一个在线程池中执行的请求
+        carried = [take_sign_time()]
+
+        def run():
+            try:
+                add_sign_time(carried.pop())
+            except IndexError:
+                pass
+            return fetch()
+        return run
+
+    def _single_flight(self, op, path, fetch):
+        if self.flights is None:
+            return fetch()
+        return self.flights.do(op, path, self._carry_sign_time(fetch))
+
+    def _cached(self, key, fetch):
+        if self.meta_cache is None:
+            return fetch()
+        res = self.meta_cache.get(key)
+        if res is None:
+            # 读取期间有写操作时不缓存可能过期的结果
+            generation = self.meta_cache.generation(key[1])
+            res = fetch()
+            if res.get('code') == 0:
+                self.meta_cache.set(key, res, generation)
+        return res
+
+    def _req(self, method, url, *args, op, idempotent=None, **kwargs):
+        """
+        发送 API 请求。连接失败、非幂等操作以外的网络错误和限流会重试，
+        都按指数退避等待。网络错误的重试受截止时间和重试预算限制，
+        限流的重试受截止时间和 :data:`MAX_THROTTLE_TIME` 限制
+
+        :param op: 操作名，见 :data:`~qcloud_cos_py3.retry.OPERATIONS`
+        :param idempotent: 是否幂等（可选），默认由操作名决定
+        """
+        assert method in ('get', 'post')
+        send_req = getattr(self.session, method)
+        timeout, idempotent, deadline = self._op_policy(op, idempotent)
+        body = kwargs.get('data')
+        dir_name = self._rate_dir(method, url)
+        res = error = throttled_at = None
+        self.retry_budget.deposit()
+        with self._observing(op) as probe:
+            while True:
+                if self.rate_limiter:
+                    self.rate_limiter.acquire(dir_name)
+                if isinstance(body, MultipartEncoder):
+                    body.rewind()
+                sent_at = time.monotonic()
+                try:
+                    resp = send_req(url, *args, timeout=(
+                        timeout.connect, self._read_timeout(timeout, deadline)
+                    ), **kwargs)
+                    probe.response(resp.status_code,
+                                   resp.request.headers.get('Content-Length'),
+                                   resp.elapsed.total_seconds())
+                    probe.bytes_received += len(resp.content)
+                    res = resp.json()
+                except Exception as e:
+                    if not is_retryable(e, idempotent):
+                        raise Exception('API request failed when %s %s: %r'
+                                        % (method, url, e)) from e
+                    error = e
+                    delay = self._retry_delay(probe.retries + 1, deadline)
+                    if delay is None:
+                        break
+                    probe.retries += 1
+                    time.sleep(delay)
+                    continue
+                code = probe.code = res['code']
+                if self.rate_limiter:
+                    self.rate_limiter.feedback(code, dir_name, sent_at)
+                # Operating too fast or
+                # Writing too fast on a single dir
+                if code in THROTTLE_CODES:
+                    probe.throttles += 1
+                    if throttled_at is None:
+                        throttled_at = time.monotonic()
+                    delay = self._throttle_delay(probe.throttles,
+                                                 throttled_at, deadline)
+                    if delay is None:
+                        break
+                    time.sleep(delay)
+                    continue
+                return res
+            raise Exception('API request failed when %s %s: %r'
+                            % (method, url, res or error))
+
+    def create_folder(self, dir_name, *, biz_attr=''):
+        """
+        `创建目录 <https://www.qcloud.com/document/product/436/6061>`_
+
+        :param dir_name: 目录名
+        :param biz_attr: 业务属性（可选）
+        """
+        dir_name = dir_name.strip('/')
+        url = self._format_url(
+            "/files/v2/{app_id}/{bucket}/{dir_name}/",
+            dir_name=dir_name
+        )
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': self._sign_more()
+        }
+        with self._invalidating(dir_name):
+            return self._req(
+                'post', url, json={'op': 'create', 'biz_attr': biz_attr},
+                headers=headers, op='create_folder'
+            )
+
+    def list_folder(self, dir_name, *, prefix=None, num=1000, context=None):
+        """
+        `列出目录 <https://www.qcloud.com/document/product/436/6062>`_
+
+        :param dir_name: 文件夹名称
+        :param prefix: 前缀
+        :param num: 查询的文件的数量，最大支持1000，默认查询数量为1000
+        :param context: 起始位置。将上次查询结果的context的字段传入，可实现翻页
+
+          注意：如果在进行列表操作的目录是真实目录而非虚拟目录
+          (上传文件路径中带有斜线会认为是虚拟目录),
+          实际列出的文件数量会是 num - 1
+
+        """
+        url = self._list_url(dir_name, prefix, num, context)
+        headers = {
+            'Authorization': self._sign_more()
+        }
+        key = ('list', normalize_path(dir_name), prefix, num, context)
+        return self._cached(key, lambda: self._hedged(
+            'list_folder', lambda: self._req('get', url, headers=headers,
+                                             op='list_folder')
+        ))
+
+    def _list_pages(self, dir_name, prefix, page_size):
+        context = None
+        while True:
+            res = self.list_folder(dir_name, prefix=prefix, num=page_size,
+                                   context=context)
+            if res['code'] != 0:
+                raise Exception('List folder failed for %s: %s'
+                                % (dir_name, res))
+            yield res['data'].get('infos', [])
+            context = res['data'].get('context')
+            if res['data'].get('listover') or not context:
+                return
+
+    def iter_folder(self, dir_name, *, prefix=None, page_size=1000,
+                    prefetch=LIST_PREFETCH):
+        """
+        遍历目录下的所有文件和子目录，自动翻页
+
+        后台线程在调用方处理当前页时预取下一页，最多缓存 ``prefetch`` 页
+
+        :param dir_name: 文件夹名称
+        :param prefix: 前缀（可选）
+        :param page_size: 每页数量（可选），默认为 1000
+        :param prefetch: 预取的页数（可选），默认为 2
+        """
+        pages = queue.Queue(maxsize=prefetch)
+        stop = threading.Event()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def fetch():
+            try:
+                for page in self._list_pages(dir_name, prefix, page_size):
+                    if stop.is_set():
+                        break
+                    put(page)
+            except Exception as e:
+                put(e)
+            put(None)
+
+        threading.Thread(target=fetch, daemon=True).start()
+        try:
+            while True:
+                page = pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                yield from page
+        finally:
+            stop.set()
+
+    def walk(self, root='', *, max_workers=WALK_WORKERS, prefix=None,
+             max_depth=None, page_size=1000):
+        """
+        递归遍历目录树，类似 ``os.walk``
+
+        用线程池并行列出子目录，每列完一个目录就返回
+        ``(dir_path, dir_names, file_infos)``，返回顺序不固定。
+        ``file_infos`` 是 COS 返回的文件信息（包含 filesize、sha 等）。
+        和 ``os.walk`` 一样，可以原地修改 ``dir_names`` 来跳过子目录。
+        遇到 -71/-143 限流时由每个请求各自等待重试
+
+        :param root: 起始目录（可选），默认为 bucket 根目录
+        :param max_workers: 并行列目录的线程数（可选），默认为 8
+        :param prefix: 只遍历起始目录下以此为前缀的文件和子目录（可选）
+        :param max_depth: 最大深度（可选），起始目录为 0，默认不限制
+        :param page_size: 每页数量（可选），默认为 1000
+        """
+        root = root.strip('/')
+
+        def list_dir(dir_path, depth):
+            dir_names, file_infos = [], []
+            for page in self._list_pages(dir_path, prefix if depth == 0
+                                         else None, page_size):
+                for info in page:
+                    if 'filesize' in info:
+                        file_infos.append(info)
+                    else:
+                        dir_names.append(info['name'].strip('/'))
+            return dir_path, depth, dir_names, file_infos
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = {executor.submit(list_dir, root, 0)}
+            try:
+                while pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        dir_path, depth, dir_names, file_infos = \
+                            future.result()
+                        yield dir_path, dir_names, file_infos
+                        if max_depth is not None and depth >= max_depth:
+                            continue
+                        for name in dir_names:
+                            sub_dir = dir_path + '/' + name if dir_path \
+                                else name
+                            pending.add(executor.submit(list_dir, sub_dir,
+                                                        depth + 1))
+            finally:
+                for future in pending:
+                    future.cancel()
+
+    def stat_folder(self, dir_name):
+        """
+        `查询目录属性 <https://www.qcloud.com/document/product/436/6063>`_
+
+        :param dir_name: 目录路径
+        """
+        dir_name = dir_name.strip('/')
+        url = self._format_url(
+            "/files/v2/{app_id}/{bucket}/{dir_name}/?op=stat",
+            dir_name=dir_name
+        )
+        headers = {
+            'Authorization': self._sign_more()
+        }
+        key = ('dir', normalize_path(dir_name))
+        return self._cached(key, lambda: self._req(
+            'get', url, headers=headers, op='stat_folder'
+        ))
+
+    def delete_folder(self, dir_name):
+        """
+        `删除目录 <https://www.qcloud.com/document/product/436/6064>`_
+
+        :param dir_name: 目录路径
+
+        注意:
+            * 虚拟目录无法删除，只能删除显式创建的目录
+            * 若显式目录中有文件存在，仍可删除该目录，但文件仍然存在于虚拟目录中
+        """
+        dir_name = dir_name.strip('/')
+        url = self._format_url(
+            '/files/v2/{app_id}/{bucket}/{dir_name}/',
+            dir_name=dir_name
+        )
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': self.signer.sign_once(
+                self.config.bucket, dir_name + '/'
+            )
+        }
+        with self._invalidating(dir_name):
+            return self._req('post', url, json={'op': 'delete'},
+                             headers=headers, op='delete_folder')
+
+    def upload_file(self, file_stream, upload_filename, *, dir_name='',
+                    biz_attr='', replace=True, mime='application/octet-stream',
+                    size=None, if_changed=False):
+        """
+        `简单上传文件 <https://www.qcloud.com/document/product/436/6066>`_
+
+        :param file_stream: 类文件对象
+        :param upload_filename: 文件名称
+        :param dir_name: 目录名称（可选）
+        :param biz_attr: 业务属性（可选）
+        :param replace: 是否覆盖（可选）
+        :param mime: 文件类型，默认为 application/octet-stream (可选)
+        :param size: 文件长度（可选），file_stream 无法 seek 时需要指定，
+          此时请求失败不会重试
+        :param if_changed: 是否只在内容变化时上传（可选）。
+          先比较远端文件的大小，大小相同再比较 SHA1，相同时不上传，
+          返回 :meth:`stat_file` 的结果。file_stream 需要可以 seek
+        """
+        remote_path = (dir_name or '') + '/' + upload_filename
+        if if_changed:
+            res = self._if_unchanged(
+                remote_path, self._seekable_size(file_stream),
+                lambda: _stream_sha1(file_stream)
+            )
+            if res is not None:
+                return res
+        insert = '0' if replace else '1'
+        url = self._upload_url(upload_filename, dir_name)
+        body = MultipartEncoder(
+            {'op': 'upload', 'biz_attr': biz_attr, 'insertOnly': insert},
+            file_stream, mime=mime, size=size
+        )
+        headers = {
+            'Content-Type': body.content_type,
+            'Authorization': self._sign_more()
+        }
+        with self._invalidating(remote_path):
+            return self._req('post', url, data=body, headers=headers,
+                             op='upload_file',
+                             idempotent=replace and body.rewindable)
+
+    def _if_unchanged(self, remote_path, size, local_sha1):
+        """
+        远端文件与本地内容相同时返回 stat_file 的结果，否则返回 None。
+        大小不同时不计算本地 SHA1
+
+        :param local_sha1: 计算本地 SHA1 的函数
+        """
+        res = self.stat_file(remote_path)
+        remote = self._remote_sha(res, size)
+        if remote is not None and remote == local_sha1():
+            return res
+        return None
+
+    async def async_upload_file(self, file_stream, upload_filename, *,
+                                dir_name="", biz_attr='', replace=True,
+                                mime='application/octet-stream'):
+        """
+        异步上传文件 (使用简单上传文件接口)
+
+        每次调用都会新建连接，大量并发请求请使用 :class:`AsyncCosBucket`
+
+        :param file_stream: 类文件对象
+        :param upload_filename: 文件名称
+        :param dir_name: 目录名称（可选）
+        :param biz_attr: 业务属性（可选）
+        :param replace: 是否覆盖（可选）
+        :param mime: 文件类型，默认为 application/octet-stream (可选)
+        """
+        TIMEOUT = 6
+        insert = '0' if replace else '1'
+        dir_name = dir_name.strip('/')
+        url = self._upload_url(upload_filename, dir_name)
+        headers = {
+            'Authorization': self._sign_more()
+        }
+        writer = _build_form(
+            {'op': 'upload', 'biz_attr': biz_attr, 'insertOnly': insert},
+            file_stream, mime
+        )
+
+        conn = aiohttp.TCPConnector(ssl=False)
+        with self._invalidating(dir_name + '/' + upload_filename):
+            async with aiohttp.ClientSession(connector=conn) as session:
+                async with session.post(url, data=writer, headers=headers,
+                                        timeout=TIMEOUT) as resp:
+                    return await resp.json()
+
+    def _upload_slice_control(self, url, file_size, slice_size, biz_attr,
+                              replace, sha=None):
+        headers = {
+            'Authorization': self._sign_more()
+        }
+        data = {
+            'op': 'upload_slice_init',
+            'filesize': str(file_size),
+            'slice_size': str(slice_size),
+            'biz_attr': biz_attr,
+            'insertOnly': '0' if replace else '1',
+        }
+        if sha:
+            data['sha'] = sha
+        r = self._req('post', url, files=data, headers=headers,
+                      op='upload_slice_init')
+        return r['data']
+
+    def _upload_slice_data(self, url, filecontent, session, offset):
+        headers = {
+            'Authorization': self._sign_more()
+        }
+        data = MultipartEncoder({
+            'op': 'upload_slice_data',
+            'session': session,
+            'offset': str(offset)
+        }, filecontent)
+        headers['Content-Type'] = data.content_type
+        r = self._req('post', url, data=data, headers=headers,
+                      op='upload_slice_data')
+        return r['data']
+
+    def _upload_slice_finish(self, url, session, file_size):
+        headers = {
+            'Authorization': self._sign_more()
+        }
+        data = {
+            'op': 'upload_slice_finish',
+            'session': session,
+            'filesize': str(file_size)
+        }
+        r = self._req('post', url, files=data, headers=headers,
+                      op='upload_slice_finish')
+        return r['data']
+
+    def _upload_slices_parallel(self, url, view, session, offsets, slice_size,
+                                max_workers, on_done, before_submit):
+
+        def upload(slice_offset):
+            content = view[slice_offset:slice_offset + slice_size]
+            self._upload_slice_data(url, filecontent=content, session=session,
+                                    offset=slice_offset)
+            return slice_offset, len(content)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            pending = set()
+            try:
+                # 最多提交 2 * max_workers 个分片，
+                # 按顺序计算 SHA1 的同时上传，分片完成的顺序不固定，按完成顺序累计进度
+                for slice_offset in offsets:
+                    before_submit(slice_offset)
+                    if len(pending) >= max_workers * 2:
+                        done, pending = wait(pending,
+                                             return_when=FIRST_COMPLETED)
+                        for future in done:
+                            on_done(*future.result())
+                    pending.add(executor.submit(upload, slice_offset))
+                for future in as_completed(pending):
+                    on_done(*future.result())
+            except BaseException:
+                for future in pending:
+                    future.cancel()
+                raise
+
+    def _verify_sha(self, file_path, sha):
+        self._check_sha(file_path, sha, self.stat_file(file_path))
+
+    def upload_slice_file(self, real_file_path, slice_size, upload_filename, *,
+                          offset=0, dir_name='', biz_attr='', replace=True,
+                          max_workers=1, progress=None, checkpoint=None,
+                          sha=None, verify=False, if_changed=False):
+        # 此代码由 @a270443177 (https://github.com/a270443177) 贡献
+        """
+        `分片上传文件 <https://cloud.tencent.com/document/product/436/6067>`_
+
+        :param real_file_path: 文件路径
+        :param slice_size: 分片大小，单位为 Byte，有效取值：
+
+          * 524288 (512 KB)
+          * 1048576 (1 MB)
+          * 2097152 (2 MB)
+          * 3145728 (3 MB)
+
+        :param upload_filename: 上传文件名
+        :param offset: 起始位移（可选），默认从头开始
+        :param dir_name: 上传目录（可选）
+        :param biz_attr: 业务属性（可选）
+        :param replace: 是否覆盖（可选）
+        :param max_workers: 并行上传分片的线程数（可选），默认为 1，即串行上传
+        :param progress: 进度回调（可选），
+          每个分片完成后以 ``progress(uploaded_bytes, file_size)`` 调用
+        :param checkpoint: 断点记录文件路径（可选）。
+          指定后每完成一个分片都会写入记录，中断后以相同参数再次调用，
+          只上传未完成的分片；上传成功后记录文件被删除
+
+          注意：
+
+          * 若 COS 返回的 ``serial_upload`` 为 1，只能串行上传，
+            此时忽略 ``max_workers``
+          * 本地文件的大小或修改时间变化后，断点记录失效，重新上传
+          * 续传时若第一个分片就失败（如会话已过期），断点记录会被删除，
+            下次调用将重新上传
+
+        :param sha: 文件的 SHA1（可选），随初始化请求发送，供 COS 校验文件内容
+        :param verify: 上传后是否校验 SHA1（可选）。
+          本地 SHA1 在上传分片的同一遍读取中计算，完成后与 stat_file 返回的
+          ``sha`` 比较，不一致时抛出异常
+        :param if_changed: 是否只在内容变化时上传（可选），同 :meth:`upload_file`，
+          内容相同时返回 stat_file 结果中的 ``data``
+
+        文件通过 mmap 映射到内存，分片以 memoryview 发送，不复制文件内容
+        """
+        assert slice_size
+        remote_path = (dir_name or '') + '/' + upload_filename
+        if if_changed:
+            res = self._if_unchanged(remote_path,
+                                     os.path.getsize(real_file_path),
+                                     lambda: _file_sha1(real_file_path))
+            if res is not None:
+                return res['data']
+        url = self._upload_url(upload_filename, dir_name)
+        file_size = os.path.getsize(real_file_path)
+
+        journal = None
+        if checkpoint is not None:
+            journal = SliceCheckpoint.load(checkpoint, url, real_file_path,
+                                           slice_size)
+            file_size = journal.file_size
+        resumed = journal is not None and journal.session is not None
+
+        if resumed:
+            session = journal.session
+            parallel = not journal.serial_upload
+        else:
+            init = self._upload_slice_control(
+                url,
+                file_size=file_size,
+                slice_size=slice_size,
+                biz_attr=biz_attr,
+                replace=replace,
+                sha=sha)
+            session = init['session']
+            parallel = not init.get('serial_upload')
+            if journal is not None:
+                journal.session = session
+                journal.serial_upload = not parallel
+                journal.save()
+
+        done = journal.done if journal is not None else set()
+        offsets = [o for o in range(offset, file_size, slice_size)
+                   if o not in done]
+        uploaded = file_size - sum(
+            min(slice_size, file_size - o) for o in offsets
+        )
+        progressed = False
+
+        def on_done(slice_offset, length):
+            nonlocal uploaded, progressed
+            progressed = True
+            uploaded += length
+            if journal is not None:
+                journal.add(slice_offset)
+            if progress is not None:
+                progress(uploaded, file_size)
+
+        try:
+            with _mapped_file(real_file_path) as view:
+                hasher = _PrefixSha1(view) if verify else None
+
+                def before_submit(slice_offset):
+                    # 续传时跳过的分片也要计入 SHA1
+                    if hasher is not None:
+                        hasher.update_to(min(slice_offset + slice_size,
+                                             file_size))
+
+                if max_workers > 1 and parallel:
+                    self._upload_slices_parallel(url, view, session, offsets,
+                                                 slice_size, max_workers,
+                                                 on_done, before_submit)
+                else:
+                    for slice_offset in offsets:
+                        before_submit(slice_offset)
+                        file_content = view[slice_offset:
+                                            slice_offset + slice_size]
+                        self._upload_slice_data(url, filecontent=file_content,
+                                                session=session,
+                                                offset=slice_offset)
+                        on_done(slice_offset, len(file_content))
+                local_sha = hasher.hexdigest() if hasher is not None else None
+                # 释放对映射内容的引用，以便关闭 mmap
+                hasher = file_content = None
+            # 所有分片都成功后才能结束上传
+            with self._invalidating(remote_path):
+                r = self._upload_slice_finish(url, session=session,
+                                              file_size=file_size)
+        except Exception:
+            if resumed and offsets and not progressed:
+                journal.remove()
+            raise
+        if journal is not None:
+            journal.remove()
+        if local_sha is not None:
+            self._verify_sha(remote_path, local_sha)
+        return r
+
+    def upload_file_from_url(self, url, file_name, *, dir_name='',
+                             biz_attr='', replace=True, timeout=None,
+                             max_size=None, slice_threshold=SLICE_THRESHOLD,
+                             slice_size=SLICE_SIZE):
+        """
+        从 url 抓取文件并上传，边下载边上传，不在内存中缓存整个文件
+
+        源站返回的 Content-Length 不超过 slice_threshold 时使用简单上传接口，
+        否则使用分片上传接口，每收到一个分片就上传。
+        源站没有返回 Content-Length 时，先在内存中缓存至多 slice_threshold 字节，
+        超出后转存到临时文件，再分片上传
+
+        :param url: 文件url地址
+        :param file_name: 文件名称
+        :param dir_name: 文件夹名称（可选）
+        :param biz_attr: 业务属性（可选）
+        :param replace: 是否覆盖（可选）
+        :param timeout: 抓取文件的超时（可选），秒数或 ``(连接超时, 读超时)``，
+          默认同下载文件
+        :param max_size: 文件大小上限（可选），单位为 Byte，默认不限制
+        :param slice_threshold: 超过此大小的文件使用分片上传（可选），默认为 20 MB
+        :param slice_size: 分片大小（可选），默认为 1 MB，
+          有效取值见 :meth:`upload_slice_file`
+        :return: 抓取失败时返回 ``{'error': 'download file failed'}``，
+          超过大小上限时返回 ``{'error': 'file too large'}``
+        """
+        if timeout is None:
+            timeout = self._download_timeout()
+        try:
+            r = self.session.get(url, stream=True, timeout=timeout,
+                                 headers={'Accept-Encoding': 'identity'})
+        except requests.RequestException:
+            return {'error': 'download file failed'}
+        with r:
+            if not r.ok:
+                return {'error': 'download file failed'}
+            size = r.headers.get('Content-Length')
+            size = int(size) if size and size.isdigit() else None
+            reader = _SourceReader(r.iter_content(UPLOAD_CHUNK_SIZE), size,
+                                   max_size)
+            if size is not None and max_size is not None and size > max_size:
+                return {'error': 'file too large'}
+            try:
+                return self._upload_from_reader(
+                    reader, file_name, dir_name, biz_attr, replace,
+                    r.headers.get('Content-Type') or 'application/octet-stream',
+                    slice_threshold, slice_size
+                )
+            except Exception:
+                if reader.error is None:
+                    raise
+                return _fetch_error(reader)
+
+    def _upload_from_reader(self, reader, file_name, dir_name, biz_attr,
+                            replace, mime, slice_threshold, slice_size):
+        if reader.size is None:
+            head = reader.read(slice_threshold + 1)
+            if len(head) <= slice_threshold:
+                return self.upload_file(BytesIO(head), file_name,
+                                        dir_name=dir_name, biz_attr=biz_attr,
+                                        replace=replace, mime=mime)
+            with tempfile.NamedTemporaryFile() as f:
+                f.write(head)
+                del head
+                for chunk in iter(lambda: reader.read(UPLOAD_CHUNK_SIZE), b''):
+                    f.write(chunk)
+                f.flush()
+                return self.upload_slice_file(f.name, slice_size, file_name,
+                                              dir_name=dir_name,
+                                              biz_attr=biz_attr,
+                                              replace=replace)
+
+        if reader.size <= slice_threshold:
+            return self.upload_file(reader, file_name, dir_name=dir_name,
+                                    biz_attr=biz_attr, replace=replace,
+                                    mime=mime, size=reader.size)
+        return self._upload_slices_from_reader(reader, file_name, dir_name,
+                                               biz_attr, replace, slice_size)
+
+    def _upload_slices_from_reader(self, reader, file_name, dir_name,
+                                   biz_attr, replace, slice_size):
+        # 按顺序读取并上传分片，内存中只保留一个分片
+        url = self._upload_url(file_name, dir_name)
+        session = self._upload_slice_control(
+            url, file_size=reader.size, slice_size=slice_size,
+            biz_attr=biz_attr, replace=replace
+        )['session']
+        for offset in range(0, reader.size, slice_size):
+            self._upload_slice_data(url, filecontent=reader.read(slice_size),
+                                    session=session, offset=offset)
+        with self._invalidating((dir_name or '') + '/' + file_name):
+            return self._upload_slice_finish(url, session=session,
+                                             file_size=reader.size)
+
+    def put(self, source, remote_path, *, biz_attr='', replace=True,
+            mime='application/octet-stream', config=None):
+        """
+        上传文件，根据文件大小和测得的上传速度自动选择简单上传、
+        分片上传或并行分片上传，以及分片大小
+
+        * 不超过 ``simple_threshold``，且按测得的速度能在 ``max_request_time``
+          内传完的文件使用简单上传
+        * 其他文件使用分片上传，分片大小取单个分片能在 ``slice_time``
+          内传完的最大有效值
+        * 不小于 ``parallel_threshold`` 的本地文件并行上传分片；
+          bytes 和流按顺序上传，内存中只保留一个分片
+        * 无法获取长度的流先缓存至多 ``simple_threshold`` 字节，
+          超出后转存到临时文件再分片上传
+
+        :param source: 本地文件路径、bytes，或类文件对象（可以无法 seek）
+        :param remote_path: COS 文件路径，如 ``dir/file.txt``
+        :param biz_attr: 业务属性（可选）
+        :param replace: 是否覆盖（可选）
+        :param mime: 文件类型（可选），只用于简单上传
+        :param config: :class:`~qcloud_cos_py3.transfer.TransferConfig`（可选），
+          默认为创建客户端时指定的配置
+        """
+        config = config or self.transfer_config
+        dir_name, _, file_name = normalize_path(remote_path).rpartition('/')
+        size = _source_size(source)
+        plan = plan_transfer(size, config, self.throughput.value)
+        start = time.monotonic()
+        res = self._put(source, size, plan, config, file_name, dir_name,
+                        biz_attr, replace, mime)
+        if size is not None and _put_succeeded(res):
+            self.throughput.record(size, time.monotonic() - start,
+                                   plan.max_workers)
+        return res
+
+    def _put(self, source, size, plan, config, file_name, dir_name, biz_attr,
+             replace, mime):
+        if isinstance(source, (str, os.PathLike)):
+            if plan.method == 'simple':
+                with open(source, 'rb') as f:
+                    return self.upload_file(f, file_name, dir_name=dir_name,
+                                            biz_attr=biz_attr,
+                                            replace=replace, mime=mime)
+            return self.upload_slice_file(
+                os.fspath(source), plan.slice_size, file_name,
+                dir_name=dir_name, biz_attr=biz_attr, replace=replace,
+                max_workers=plan.max_workers
+            )
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = BytesIO(source)
+        if plan.method == 'simple':
+            return self.upload_file(source, file_name, dir_name=dir_name,
+                                    biz_attr=biz_attr, replace=replace,
+                                    mime=mime, size=size)
+        reader = _SourceReader(
+            iter(lambda: source.read(UPLOAD_CHUNK_SIZE), b''), size, None
+        )
+        if size is None:
+            return self._upload_from_reader(
+                reader, file_name, dir_name, biz_attr, replace, mime,
+                config.simple_threshold, plan.slice_size
+            )
+        return self._upload_slices_from_reader(reader, file_name, dir_name,
+                                               biz_attr, replace,
+                                               plan.slice_size)
+
+    def get_file(self, file_path):
+        """
+        :param file_path: 文件路径
+        """
+        url, headers = self._download_req(file_path)
+
+        def download():
+            with self._observing('get_file') as probe:
+                r = self.session.get(url, headers=headers,
+                                     timeout=self._download_timeout())
+                probe.response(r.status_code, 0, r.elapsed.total_seconds())
+                probe.bytes_received = len(r.content)
+                return r.content
+
+        return self._single_flight('get_file', file_path,
+                                   lambda: self._hedged('get_file', download))
+
+    def iter_file(self, file_path, *, chunk_size=DOWNLOAD_CHUNK_SIZE):
+        """
+        流式下载文件，按块返回文件内容，内存占用与文件大小无关
+
+        :param file_path: 文件路径
+        :param chunk_size: 块大小（可选），默认为 64 KB
+        """
+        url, headers = self._download_req(file_path)
+        with self._observing('get_file') as probe, \
+                self.session.get(url, headers=headers, stream=True,
+                                 timeout=self._download_timeout()) as r:
+            probe.response(r.status_code, 0, r.elapsed.total_seconds())
+            r.raise_for_status()
+            for chunk in r.iter_content(chunk_size):
+                probe.bytes_received += len(chunk)
+                yield chunk
+
+    def _download_range(self, file_path, tmp_path, start, end, chunk_size):
+        """
+        下载一个分段写入临时文件的对应位置
+
+        :return: 写入的字节数，服务端不支持 Range 时返回 None
+        """
+        self.retry_budget.deposit()
+        with self._observing('get_file') as probe:
+            while True:
+                url, headers = self._download_req(file_path)
+                probe.sign_time += take_sign_time()
+                headers['Range'] = 'bytes=%d-%d' % (start, end)
+                try:
+                    with self.session.get(
+                            url, headers=headers, stream=True,
+                            timeout=self._download_timeout()) as r, \
+                            open(tmp_path, 'r+b') as f:
+                        probe.response(r.status_code, 0,
+                                       r.elapsed.total_seconds())
+                        if r.status_code == 200:
+                            # 忽略了 Range 头，重试也只会得到整个文件
+                            return None
+                        if r.status_code != 206:
+                            r.raise_for_status()
+                            raise ValueError('Unexpected status %d'
+                                             % r.status_code)
+                        f.seek(start)
+                        written = 0
+                        for chunk in r.iter_content(chunk_size):
+                            written += f.write(chunk)
+                        probe.bytes_received += written
+                    if written == end - start + 1:
+                        return written
+                except (requests.RequestException, ValueError):
+                    pass
+                delay = self._retry_delay(probe.retries + 1, None)
+                if delay is None:
+                    break
+                probe.retries += 1
+                time.sleep(delay)
+            raise Exception('Download failed for %s bytes %d-%d'
+                            % (file_path, start, end))
+
+    def download_to_file(self, file_path, local_path, *,
+                         chunk_size=DOWNLOAD_CHUNK_SIZE, max_workers=1,
+                         part_size=DOWNLOAD_PART_SIZE):
+        """
+        流式下载文件到本地。先写入同目录下的临时文件，完成后再重命名，
+        下载失败不会留下不完整的文件
+
+        :param file_path: 文件路径
+        :param local_path: 本地文件路径
+        :param chunk_size: 块大小（可选），默认为 64 KB
+        :param max_workers: 并行下载的线程数（可选），默认为 1。
+          大于 1 时先查询文件大小，再用 Range 请求并行下载各个分段，
+          直接写入预分配的本地文件的对应位置，失败的分段单独重试；
+          服务端不支持 Range 时改为单个流下载
+        :param part_size: 并行下载时每个分段的大小（可选），默认为 8 MB
+        :return: 下载的字节数
+        """
+        if max_workers > 1:
+            res = self.stat_file(file_path)
+            if res['code'] != 0:
+                raise Exception('Stat file failed for %s: %s'
+                                % (file_path, res))
+            file_size = res['data']['filesize']
+            with _atomic_path(local_path) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    f.truncate(file_size)
+                with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                    futures = [
+                        executor.submit(self._download_range, file_path,
+                                        tmp_path, start, end, chunk_size)
+                        for start, end in _split_ranges(file_size, part_size)
+                    ]
+                    try:
+                        sizes = [f.result() for f in futures]
+                    except BaseException:
+                        for future in futures:
+                            future.cancel()
+                        raise
+                if None not in sizes:
+                    return sum(sizes)
+                # 服务端不支持 Range 时改为单个流下载
+                return self._stream_to_file(file_path, tmp_path, chunk_size)
+
+        with _atomic_path(local_path) as tmp_path:
+            return self._stream_to_file(file_path, tmp_path, chunk_size)
+
+    def _stream_to_file(self, file_path, tmp_path, chunk_size):
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            for chunk in self.iter_file(file_path, chunk_size=chunk_size):
+                size += f.write(chunk)
+        return size
+
+    def move_file(self, source_file_path, dest_file_path):
+        """
+        `移动文件 <https://cloud.tencent.com/document/product/436/6730>`_
+
+        :param source_file_path: 源文件路径
+        :param dest_file_path: 目标路径
+
+        注意:
+            目标路径若不以 / 开头，则认为是相对路径
+        """
+        url = self._format_url(
+            '/files/v2/{app_id}/{bucket}/' + source_file_path
+        )
+        headers = {
+            'Authorization': self.signer.sign_once(
+                self.config.bucket, source_file_path
+            )
+        }
+        dest = self._dest_path(source_file_path, dest_file_path)
+        with self._invalidating(source_file_path, dest):
+            return self._req(
+                'post', url,
+                data={'op': 'move', 'dest_fileid': dest_file_path,
+                      'to_over_write': '0'},
+                files={'filecontent': ('', '', 'application/octet-stream')},
+                headers=headers, op='move_file'
+            )
+
+    def copy_file(self, source_file_path, dest_file_path):
+        """
+        `拷贝文件 <https://www.qcloud.com/document/product/436/7419>`_
+
+        :param source_file_path: 源文件路径
+        :param dest_file_path: 目标路径
+
+        注意:
+            目标路径若不以 / 开头，则认为是相对路径
+        """
+        url = self._format_url(
+            '/files/v2/{app_id}/{bucket}/' + source_file_path
+        )
+        headers = {
+            'Authorization': self.signer.sign_once(
+                self.config.bucket, source_file_path
+            )
+        }
+        dest = self._dest_path(source_file_path, dest_file_path)
+        with self._invalidating(dest):
+            return self._req(
+                'post', url,
+                data={'op': 'copy', 'dest_fileid': dest_file_path,
+                      'to_over_write': '0'},
+                files={'filecontent': ('', '', 'application/octet-stream')},
+                headers=headers, op='copy_file'
+            )
+
+    def delete_file(self, file_path):
+        """
+        `删除文件 <https://www.qcloud.com/document/product/436/6073>`_
+
+        :param file_path: 文件路径
+        """
+        file_path = file_path.lstrip('/')
+        url = self._format_url(
+            '/files/v2/{app_id}/{bucket}/' + file_path
+        )
+        headers = {
+            'Authorization': self.signer.sign_once(self.config.bucket, file_path)
+        }
+        with self._invalidating(file_path):
+            return self._req('post', url, json={'op': 'delete'},
+                             headers=headers, op='delete_file')
+
+    def stat_file(self, file_path):
+        """
+        `查询文件属性 <https://www.qcloud.com/document/api/436/6069>`_
+
+        :param file_path: 文件路径
+        """
+        url = self._format_url(
+            '/files/v2/{app_id}/{bucket}/{file_path}?op=stat',
+            file_path=file_path
+        )
+        headers = {
+            'Content-Type': 'application/json',
+            'Authorization': self._sign_more()
+        }
+
+        def fetch():
+            return self._hedged('stat_file', lambda: self._req(
+                'get', url, headers=headers, op='stat_file'
+            ))
 
+        key = ('file', normalize_path(file_path))
+        return self._cached(key, lambda: self._single_flight(
+            'stat_file', file_path, fetch
+        ))
 
-CosConfig = namedtuple(
-    'CosConfig',
-    ['app_id', 'secret_id', 'secret_key', 'region', 'bucket']
-)
+    def update_file_status(self, file_path, *, authority='eInvalid',
+                           custom_headers=None):
+        """
+        `修改文件属性 <https://www.qcloud.com/document/api/436/6072>`_
 
-MAX_RETRY = 3
+        :param file_path: 文件路径
+        :param authority: 文件权限
+        :param custom_headers: 自定义文件头信息
+        :type authority: eInvalid / eWRPrivate / eWPrivateRPublic
+        """
+        file_path = file_path.lstrip('/')
+        assert authority in (
+            'eInvalid', # 空权限，此时系统会默认调取 Bucket 权限
+            'eWRPrivate', # 私有读写
+            'eWPrivateRPublic' # 公有读私有写
+        )
+
+        url = self._format_url(
+            '/files/v2/{app_id}/{bucket}/' + file_path
+        )
+        headers = {
+            'Authorization': self.signer.sign_once(self.config.bucket, file_path)
+        }
+        payload = {
+            'op': 'update',
+            'authority': authority,
+            'custom_headers': custom_headers or {}
+        }
+        with self._invalidating(file_path):
+            return self._req('post', url, json=payload, headers=headers,
+                             op='update_file_status')
+
+    def sync_dir(self, local_root, remote_dir, *, max_workers=SYNC_WORKERS,
+                 slice_threshold=SLICE_THRESHOLD, slice_size=SLICE_SIZE,
+                 dry_run=False, delete=False):
+        """
+        增量同步本地目录到 COS
+
+        用 :meth:`walk` 列出远端文件，先比较大小，大小相同再比较 SHA1，
+        只并行上传新增或有变化的文件，大文件使用分片上传
+
+        :param local_root: 本地目录
+        :param remote_dir: COS 目录
+        :param max_workers: 并行上传的线程数（可选），默认为 4
+        :param slice_threshold: 超过此大小的文件使用分片上传（可选），默认为 20 MB
+        :param slice_size: 分片大小（可选），默认为 1 MB
+        :param dry_run: 只返回同步计划，不实际上传或删除（可选）
+        :param delete: 是否删除本地不存在的远端文件（可选）
+        :return: ``{'upload': [...], 'delete': [...], 'unchanged': [...],
+          'errors': {...}}``，路径均为相对于同步目录的路径
+        :raises ValueError: local_root 不是目录。
+          否则远端文件都会被当作本地已删除，``delete=True`` 时被全部删除
+        """
+        if not os.path.isdir(local_root):
+            raise ValueError('local_root is not a directory: %s' % local_root)
+        remote_dir = remote_dir.strip('/')
+        remote = {}
+        for dir_path, _, file_infos in self.walk(remote_dir):
+            rel_dir = dir_path[len(remote_dir):].strip('/')
+            for info in file_infos:
+                rel_path = rel_dir + '/' + info['name'] if rel_dir \
+                    else info['name']
+                remote[rel_path] = info
+
+        local = {}
+        for dir_path, _, file_names in os.walk(local_root):
+            for name in file_names:
+                local_path = os.path.join(dir_path, name)
+                rel_path = os.path.relpath(local_path, local_root)
+                local[rel_path.replace(os.sep, '/')] = local_path
+
+        def is_changed(rel_path):
+            info = remote.get(rel_path)
+            if info is None:
+                return True
+            if os.path.getsize(local[rel_path]) != info.get('filesize'):
+                return True
+            sha = info.get('sha') or ''
+            return _file_sha1(local[rel_path]) != sha.lower()
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            changed = dict(zip(local, executor.map(is_changed, local)))
+        report = {
+            'upload': sorted(p for p in local if changed[p]),
+            'delete': sorted(set(remote) - set(local)) if delete else [],
+            'unchanged': sorted(p for p in local if not changed[p]),
+            'errors': {},
+        }
+        if dry_run:
+            return report
+
+        def upload(rel_path):
+            local_path = local[rel_path]
+            dir_name, _, file_name = (remote_dir + '/' + rel_path) \
+                .rpartition('/')
+            if os.path.getsize(local_path) > slice_threshold:
+                self.upload_slice_file(local_path, slice_size, file_name,
+                                       dir_name=dir_name)
+                return None
+            with open(local_path, 'rb') as f:
+                res = self.upload_file(f, file_name, dir_name=dir_name)
+            return None if res.get('code') == 0 else res
+
+        def remove(rel_path):
+            res = self.delete_file(remote_dir + '/' + rel_path)
+            return None if res.get('code') == 0 else res
+
+        def run(func, rel_path):
+            try:
+                return rel_path, func(rel_path)
+            except Exception as e:
+                return rel_path, str(e)
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = [executor.submit(run, upload, p)
+                       for p in report['upload']]
+            futures += [executor.submit(run, remove, p)
+                        for p in report['delete']]
+            for future in as_completed(futures):
+                rel_path, error = future.result()
+                if error is not None:
+                    report['errors'][rel_path] = error
+        return report
 
+    def _run_batch(self, func, items, max_workers):
 
-class MyWriter(MultipartWriter):
+        def run(item):
+            try:
+                res = func(item)
+            except Exception as e:
+                return BatchResult(item, False, None, str(e))
+            code = res.get('code')
+            return BatchResult(item, code == 0, code,
+                               None if code == 0 else res.get('message'))
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            return list(executor.map(run, items))
+
+    def delete_many(self, file_paths, *, max_workers=DEFAULT_POOL_SIZE):
+        """
+        并行删除多个文件
+
+        失败不会中断其余文件的删除，返回与输入顺序一致的
+        :class:`BatchResult` 列表 ``(item, ok, code, error)``。
+        遇到 -71/-143 限流时，由限速器统一降低请求速率
+
+        :param file_paths: 文件路径列表
+        :param max_workers: 并发数（可选），默认为 10，
+          不宜超过连接池大小 ``pool_size``
+        """
+        return self._run_batch(self.delete_file, file_paths, max_workers)
+
+    def copy_many(self, path_pairs, *, max_workers=DEFAULT_POOL_SIZE):
+        """
+        并行拷贝多个文件，参数和返回值同 :meth:`delete_many`
+
+        :param path_pairs: ``(源文件路径, 目标路径)`` 列表
+        """
+        return self._run_batch(lambda pair: self.copy_file(*pair),
+                               path_pairs, max_workers)
+
+    def move_many(self, path_pairs, *, max_workers=DEFAULT_POOL_SIZE):
+        """
+        并行移动多个文件，参数和返回值同 :meth:`delete_many`
+
+        :param path_pairs: ``(源文件路径, 目标路径)`` 列表
+        """
+        return self._run_batch(lambda pair: self.move_file(*pair),
+                               path_pairs, max_workers)
+
+
+class AsyncCosBucket(_BaseCosBucket):
     """
-    aiohttp 的 HTTP header 中，boundary 是带引号的，
-    但 COS 不支持带引号的 boundary，只能重写writer，把引号删掉
+    异步 COS bucket 客户端，接口与 :class:`CosBucket` 一致
+
+    所有请求共用一个 ``aiohttp.ClientSession``，
+    可用 ``async with AsyncCosBucket(...) as bucket:`` 在结束时关闭
+
+    :param limit: 连接总数上限（可选），默认为 100
+    :param limit_per_host: 单个 host 的连接数上限（可选），默认为 0，即不限制
+    :param sign_expire: 多次签名的有效期，单位为秒（可选），默认为 30 秒
+    :param sign_cache: 是否缓存多次签名（可选），默认为 True
+    :param rate_limiter: 限速器（可选），默认为新建的
+      :class:`~qcloud_cos_py3.ratelimit.AsyncRateLimiter`；传入 False 则不限速
+    :param timeouts: 各类操作的超时配置（可选），同 :class:`CosBucket`
+    :param retry_budget: 重试预算（可选），同 :class:`CosBucket`
+    :param hedge_delay: 对冲请求的等待时间（可选），同 :class:`CosBucket`，
+      落后的请求会被取消
+    :param max_hedges: 最多额外发出的对冲请求数（可选），默认为 1
+    :param single_flight: 是否合并相同的并发读请求（可选），同 :class:`CosBucket`
+    :param observers: 请求观察者列表（可选），同 :class:`CosBucket`
+    :param endpoint: 服务地址（可选），同 :class:`CosBucket`
+    :param transfer_config: :meth:`put` 选择上传方式的阈值（可选），同 :class:`CosBucket`
     """
 
-    def __init__(self, subtype='mixed', boundary=None):
-        super().__init__(subtype=subtype, boundary=boundary)
-        self._content_type = self._content_type.replace('"', '')
+    def __init__(self, app_id, secret_id, secret_key, bucket_name, region='sh',
+                 *, limit=DEFAULT_CONN_LIMIT, limit_per_host=0,
+                 sign_expire=SIGN_EXPIRE, sign_cache=True, rate_limiter=None,
+                 timeouts=None, retry_budget=None, hedge_delay=None,
+                 max_hedges=1, single_flight=False, observers=(),
+                 endpoint=None, transfer_config=None):
+        if rate_limiter is None:
+            rate_limiter = AsyncRateLimiter()
+        super().__init__(app_id, secret_id, secret_key, bucket_name, region,
+                         sign_expire, sign_cache, rate_limiter, timeouts,
+                         retry_budget, hedge_delay, max_hedges, observers,
+                         endpoint, transfer_config)
+        if single_flight:
+            self.flights = AsyncSingleFlight()
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self._session = None
 
-    def append_payload(self, payload):
-        """Adds a new body part to multipart writer."""
-        if payload.content_type == 'application/octet-stream':
-            payload.headers[CONTENT_TYPE] = payload.content_type
+    async def __aenter__(self):
+        return self
 
-        # render headers
-        headers = ''.join(
-            [k + ': ' + v + '\r\n' for k, v in payload.headers.items()]
-        ).encode('utf-8') + b'\r\n'
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
 
-        self._parts.append((payload, headers, '', ''))
+    @property
+    def session(self):
+        if self._session is None or self._session.closed:
+            conn = aiohttp.TCPConnector(limit=self.limit,
+                                        limit_per_host=self.limit_per_host,
+                                        ssl=False)
+            self._session = aiohttp.ClientSession(connector=conn)
+        return self._session
 
+    def _download_timeout(self):
+        connect, read = super()._download_timeout()
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
 
-class CosBucket(object):
+    async def _single_flight(self, op, path, fetch):
+        if self.flights is None:
+            return await fetch()
+        return await self.flights.do(op, path, self._carry_sign_time(fetch))
 
-    def __init__(self, app_id, secret_id, secret_key, bucket_name, region='sh'):
-        self.config = CosConfig(app_id, secret_id, secret_key, region, bucket_name)
-        self.signer = CosAuth(self.config)
-        self.headers = {'Content-Type': 'application/json'}
+    async def _hedged(self, op, fetch):
+        if self.hedge_delay is None:
+            return await fetch()
+        fetch = async_timed(self.latency, op, fetch)
+        delay = self._hedge_delay(op)
+        if delay is None:
+            return await fetch()
+        return await async_hedged_call(self._carry_sign_time(fetch), delay,
+                                       self.max_hedges)
 
-    def _format_url(self, url_pattern, **extra):
-        url_pattern = "http://{region}.file.myqcloud.com" + url_pattern
-        return url_pattern.format(**self.config._asdict(), **extra)
+    @staticmethod
+    def _carry_sign_time(fetch):
+        # 把调用方的签名耗时交给第一个在新 task 中执行的请求
+        carried = [take_sign_time()]
 
-    def _req(self, method, url, *args, **kwargs):
-        assert method in ('get', 'post')
-        send_req = getattr(requests, method)
-        res = {}
-        for _ in range(MAX_RETRY):
+        async def run():
             try:
-                res = send_req(url, *args, **kwargs).json()
-            except:
-                continue
-            code = res['code']
-            # Operating too fast or
-            # Writing too fast on a single dir
-            if code in (-71, -143):
-                time.sleep(random.randint(1, 3))
-                continue
-            else:
+                add_sign_time(carried.pop())
+            except IndexError:
+                pass
+            return await fetch()
+        return run
+
+    async def close(self):
+        """
+        关闭连接池
+        """
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    async def _req(self, method, url, *, op, idempotent=None, **kwargs):
+        assert method in ('get', 'post')
+        timeout, idempotent, deadline = self._op_policy(op, idempotent)
+        dir_name = self._rate_dir(method, url)
+        res = error = throttled_at = None
+        self.retry_budget.deposit()
+        with self._observing(op) as probe:
+            while True:
+                if self.rate_limiter:
+                    await self.rate_limiter.acquire(dir_name)
+                client_timeout = aiohttp.ClientTimeout(
+                    sock_connect=timeout.connect,
+                    sock_read=self._read_timeout(timeout, deadline),
+                    total=(None if deadline is None
+                           else max(deadline - time.monotonic(), 0.001)),
+                )
+                sent_at = time.monotonic()
+                try:
+                    async with self.session.request(method, url,
+                                                    timeout=client_timeout,
+                                                    **kwargs) as resp:
+                        probe.response(
+                            resp.status,
+                            resp.request_info.headers.get('Content-Length'),
+                            time.monotonic() - sent_at
+                        )
+                        content = await resp.read()
+                        probe.bytes_received += len(content)
+                        res = json.loads(content)
+                except Exception as e:
+                    if not is_retryable(e, idempotent):
+                        raise Exception('API request failed when %s %s: %r'
+                                        % (method, url, e)) from e
+                    error = e
+                    delay = self._retry_delay(probe.retries + 1, deadline)
+                    if delay is None:
+                        break
+                    probe.retries += 1
+                    await asyncio.sleep(delay)
+                    continue
+                code = probe.code = res['code']
+                if self.rate_limiter:
+                    self.rate_limiter.feedback(code, dir_name, sent_at)
+                # Operating too fast or
+                # Writing too fast on a single dir
+                if code in THROTTLE_CODES:
+                    probe.throttles += 1
+                    if throttled_at is None:
+                        throttled_at = time.monotonic()
+                    delay = self._throttle_delay(probe.throttles,
+                                                 throttled_at, deadline)
+                    if delay is None:
+                        break
+                    await asyncio.sleep(delay)
+                    continue
                 return res
-        else:
-            raise Exception('API request failed when %s %s: %s'
-                            % (method, url, res))
+            raise Exception('API request failed when %s %s: %r'
+                            % (method, url, res or error))
 
-    def create_folder(self, dir_name, *, biz_attr=''):
+    async def create_folder(self, dir_name, *, biz_attr=''):
         """
         `创建目录 <https://www.qcloud.com/document/product/436/6061>`_
 
@@ -88,44 +2160,68 @@ class CosBucket(object):
             dir_name=dir_name
         )
         headers = {
-            'Content-Type': 'application/json',
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
+            'Authorization': self._sign_more()
         }
-        return self._req(
+        return await self._req(
             'post', url, json={'op': 'create', 'biz_attr': biz_attr},
-            headers=headers
+            headers=headers, op='create_folder'
         )
 
-    def list_folder(self, dir_name, *, prefix=None, num=1000, context=None):
+    async def list_folder(self, dir_name, *, prefix=None, num=1000,
+                          context=None):
         """
         `列出目录 <https://www.qcloud.com/document/product/436/6062>`_
 
-        :param dir_name: 文件夹名称
-        :param prefix: 前缀
-        :param num: 查询的文件的数量，最大支持1000，默认查询数量为1000
-        :param context: 起始位置。将上次查询结果的context的字段传入，可实现翻页
-
-          注意：如果在进行列表操作的目录是真实目录而非虚拟目录
-          (上传文件路径中带有斜线会认为是虚拟目录),
-          实际列出的文件数量会是 num - 1
+        参数同 :meth:`CosBucket.list_folder`
+        """
+        url = self._list_url(dir_name, prefix, num, context)
+        headers = {
+            'Authorization': self._sign_more()
+        }
+        return await self._hedged('list_folder', lambda: self._req(
+            'get', url, headers=headers, op='list_folder'
+        ))
 
+    async def iter_folder(self, dir_name, *, prefix=None, page_size=1000,
+                          prefetch=LIST_PREFETCH):
         """
-        url = self._format_url("/files/v2/{app_id}/{bucket}/")
-        if dir_name:
-            url += str(dir_name) + "/"
-        if prefix:
-            url += str(prefix)
+        遍历目录下的所有文件和子目录，自动翻页并预取下一页，
+        参数同 :meth:`CosBucket.iter_folder`
+        """
+        pages = asyncio.Queue(maxsize=prefetch)
 
-        url += "?op=list&num=" + str(num)
-        if context is not None:
-            url += '&context=' + str(context)
+        async def fetch():
+            context = None
+            try:
+                while True:
+                    res = await self.list_folder(dir_name, prefix=prefix,
+                                                 num=page_size,
+                                                 context=context)
+                    if res['code'] != 0:
+                        raise Exception('List folder failed for %s: %s'
+                                        % (dir_name, res))
+                    await pages.put(res['data'].get('infos', []))
+                    context = res['data'].get('context')
+                    if res['data'].get('listover') or not context:
+                        break
+            except Exception as e:
+                await pages.put(e)
+            await pages.put(None)
 
-        headers = {
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
-        }
-        return self._req('get', url, headers=headers)
+        task = asyncio.ensure_future(fetch())
+        try:
+            while True:
+                page = await pages.get()
+                if page is None:
+                    return
+                if isinstance(page, Exception):
+                    raise page
+                for info in page:
+                    yield info
+        finally:
+            task.cancel()
 
-    def stat_folder(self, dir_name):
+    async def stat_folder(self, dir_name):
         """
         `查询目录属性 <https://www.qcloud.com/document/product/436/6063>`_
 
@@ -137,19 +2233,16 @@ class CosBucket(object):
             dir_name=dir_name
         )
         headers = {
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
+            'Authorization': self._sign_more()
         }
-        return self._req('get', url, headers=headers)
+        return await self._req('get', url, headers=headers,
+                               op='stat_folder')
 
-    def delete_folder(self, dir_name):
+    async def delete_folder(self, dir_name):
         """
         `删除目录 <https://www.qcloud.com/document/product/436/6064>`_
 
-        :param dir_name: 目录路径
-
-        注意:
-            * 虚拟目录无法删除，只能删除显式创建的目录
-            * 若显式目录中有文件存在，仍可删除该目录，但文件仍然存在于虚拟目录中
+        参数同 :meth:`CosBucket.delete_folder`
         """
         dir_name = dir_name.strip('/')
         url = self._format_url(
@@ -157,87 +2250,60 @@ class CosBucket(object):
             dir_name=dir_name
         )
         headers = {
-            'Content-Type': 'application/json',
             'Authorization': self.signer.sign_once(
                 self.config.bucket, dir_name + '/'
             )
         }
-        return self._req('post', url, json={'op': 'delete'}, headers=headers)
+        return await self._req('post', url, json={'op': 'delete'},
+                               headers=headers, op='delete_folder')
 
-    def upload_file(self, file_stream, upload_filename, *, dir_name='',
-                    biz_attr='', replace=True, mime='application/octet-stream'):
+    async def upload_file(self, file_stream, upload_filename, *, dir_name='',
+                          biz_attr='', replace=True,
+                          mime='application/octet-stream', size=None,
+                          if_changed=False):
         """
         `简单上传文件 <https://www.qcloud.com/document/product/436/6066>`_
 
-        :param file_stream: 类文件对象
-        :param upload_filename: 文件名称
-        :param dir_name: 目录名称（可选）
-        :param biz_attr: 业务属性（可选）
-        :param replace: 是否覆盖（可选）
-        :param mime: 文件类型，默认为 application/octet-stream (可选)
+        参数同 :meth:`CosBucket.upload_file`，
+        file_stream 的 read 方法也可以是协程
         """
+        if if_changed:
+            res = await self._if_unchanged(
+                (dir_name or '') + '/' + upload_filename,
+                self._seekable_size(file_stream),
+                lambda: _stream_sha1(file_stream)
+            )
+            if res is not None:
+                return res
         insert = '0' if replace else '1'
-        url = self._format_url('/files/v2/{app_id}/{bucket}')
-        if dir_name is not None:
-            url += '/' + dir_name
-        url += '/' + upload_filename
+        dir_name = dir_name.strip('/')
+        url = self._upload_url(upload_filename, dir_name)
         headers = {
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
+            'Authorization': self._sign_more()
         }
-        return self._req(
-            'post', url,
-            data={'op': 'upload', 'biz_attr': biz_attr, 'insertOnly': insert},
-            files={'filecontent': ('', file_stream, mime)},
-            headers=headers
+        writer = _build_form(
+            {'op': 'upload', 'biz_attr': biz_attr, 'insertOnly': insert},
+            file_stream, mime, size
         )
+        with self._invalidating(dir_name + '/' + upload_filename):
+            return await self._req(
+                'post', url, data=writer, headers=headers, op='upload_file',
+                idempotent=replace and writer._value.rewindable
+            )
 
-    async def async_upload_file(self, file_stream, upload_filename, *,
-                                dir_name="", biz_attr='', replace=True,
-                                mime='application/octet-stream'):
-        """
-        异步上传文件 (使用简单上传文件接口)
+    async def _if_unchanged(self, remote_path, size, local_sha1):
+        # 同 CosBucket._if_unchanged，在线程池中计算本地 SHA1，不阻塞事件循环
+        res = await self.stat_file(remote_path)
+        remote = self._remote_sha(res, size)
+        if remote is not None and remote == await \
+                asyncio.get_running_loop().run_in_executor(None, local_sha1):
+            return res
+        return None
 
-        :param file_stream: 类文件对象
-        :param upload_filename: 文件名称
-        :param dir_name: 目录名称（可选）
-        :param biz_attr: 业务属性（可选）
-        :param replace: 是否覆盖（可选）
-        :param mime: 文件类型，默认为 application/octet-stream (可选)
-        """
-        TIMEOUT = 6
-        insert = '0' if replace else '1'
-        dir_name = dir_name.strip('/')
-        url = self._format_url('/files/v2/{app_id}/{bucket}')
-        if dir_name is not None:
-            url += '/' + dir_name
-        url += '/' + upload_filename
+    async def _upload_slice_control(self, url, file_size, slice_size,
+                                    biz_attr, replace, sha=None):
         headers = {
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
-        }
-        pl_op = StringPayload('upload')
-        pl_op.set_content_disposition('form-data', name='op')
-        pl_bz = StringPayload(biz_attr)
-        pl_bz.set_content_disposition('form-data', name='biz_attr')
-        pl_ir = StringPayload(insert)
-        pl_ir.set_content_disposition('form-data', name='insertOnly')
-        pl_fc = BytesPayload(file_stream.read())
-        pl_fc.set_content_disposition('form-data', name='filecontent', filename='')
-        pl_fc._headers[CONTENT_DISPOSITION] = 'form-data; name="filecontent"; filename=""'
-        with MyWriter('form-data') as writer:
-            writer.append(pl_op)
-            writer.append(pl_bz)
-            writer.append(pl_ir)
-            writer.append(pl_fc)
-
-        conn = aiohttp.TCPConnector(verify_ssl=False)
-        async with aiohttp.ClientSession(connector=conn) as session:
-            async with session.post(url, data=writer, headers=headers,
-                                    timeout=TIMEOUT) as resp:
-                return await resp.json()
-
-    def _upload_slice_control(self, file_size, slice_size, biz_attr, replace):
-        headers = {
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
+            'Authorization': self._sign_more()
         }
         data = {
             'op': 'upload_slice_init',
@@ -246,118 +2312,369 @@ class CosBucket(object):
             'biz_attr': biz_attr,
             'insertOnly': '0' if replace else '1',
         }
-        r = self._req('post', self.url, files=data, headers=headers)
-        return r['data']['session']
+        if sha:
+            data['sha'] = sha
+        r = await self._req('post', url, data=_build_form(data),
+                            headers=headers, op='upload_slice_init')
+        return r['data']
 
-    def _upload_slice_data(self, filecontent, session, offset):
+    async def _upload_slice_data(self, url, filecontent, session, offset):
         headers = {
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
+            'Authorization': self._sign_more()
         }
         data = {
             'op': 'upload_slice_data',
-            'filecontent': filecontent,
             'session': session,
             'offset': str(offset)
         }
-        r = self._req('post', self.url, files=data, headers=headers)
+        r = await self._req('post', url, data=_build_form(data, filecontent),
+                            headers=headers, op='upload_slice_data')
         return r['data']
 
-    def _upload_slice_finish(self, session, file_size):
+    async def _upload_slice_finish(self, url, session, file_size):
         headers = {
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
+            'Authorization': self._sign_more()
         }
         data = {
             'op': 'upload_slice_finish',
             'session': session,
             'filesize': str(file_size)
         }
-        r = self._req('post', self.url, files=data, headers=headers)
+        r = await self._req('post', url, data=_build_form(data),
+                            headers=headers, op='upload_slice_finish')
         return r['data']
 
-    def upload_slice_file(self, real_file_path, slice_size, upload_filename, *,
-                          offset=0, dir_name='', biz_attr='', replace=True):
-        # 此代码由 @a270443177 (https://github.com/a270443177) 贡献
+    async def upload_slice_file(self, real_file_path, slice_size,
+                                upload_filename, *, offset=0, dir_name='',
+                                biz_attr='', replace=True, sha=None,
+                                verify=False, if_changed=False):
         """
         `分片上传文件 <https://cloud.tencent.com/document/product/436/6067>`_
 
-        :param real_file_path: 文件路径
-        :param slice_size: 分片大小，单位为 Byte，有效取值：
-
-          * 524288 (512 KB)
-          * 1048576 (1 MB)
-          * 2097152 (2 MB)
-          * 3145728 (3 MB)
-
-        :param upload_filename: 上传文件名
-        :param offset: 起始位移（可选），默认从头开始
-        :param dir_name: 上传目录（可选）
-        :param biz_attr: 业务属性（可选）
-        :param replace: 是否覆盖（可选）
-
+        参数同 :meth:`CosBucket.upload_slice_file`
         """
         assert slice_size
-        self.url = self._format_url('/files/v2/{app_id}/{bucket}')
-        if dir_name is not None:
-            self.url += '/' + dir_name
-        self.url += '/' + upload_filename
+        url = self._upload_url(upload_filename, dir_name)
+        remote_path = (dir_name or '') + '/' + upload_filename
+        if if_changed:
+            res = await self._if_unchanged(remote_path,
+                                           os.path.getsize(real_file_path),
+                                           lambda: _file_sha1(real_file_path))
+            if res is not None:
+                return res['data']
         file_size = os.path.getsize(real_file_path)
-        session = self._upload_slice_control(
+        session = (await self._upload_slice_control(
+            url,
             file_size=file_size,
             slice_size=slice_size,
             biz_attr=biz_attr,
-            replace=replace)
+            replace=replace,
+            sha=sha))['session']
 
-        with open(real_file_path, 'rb') as local_file:
+        with _mapped_file(real_file_path) as view:
+            hasher = _PrefixSha1(view) if verify else None
+            file_content = None
             while offset < file_size:
-                file_content = local_file.read(slice_size)
-                self._upload_slice_data(filecontent=file_content,
-                                        session=session, offset=offset)
+                if hasher is not None:
+                    hasher.update_to(min(offset + slice_size, file_size))
+                file_content = view[offset:offset + slice_size]
+                await self._upload_slice_data(url, filecontent=file_content,
+                                              session=session, offset=offset)
                 offset += slice_size
-            r = self._upload_slice_finish(session=session, file_size=file_size)
+            local_sha = hasher.hexdigest() if hasher is not None else None
+            hasher = file_content = None
+        with self._invalidating(remote_path):
+            r = await self._upload_slice_finish(url, session=session,
+                                                file_size=file_size)
+        if local_sha is not None:
+            self._check_sha(remote_path, local_sha,
+                            await self.stat_file(remote_path))
         return r
 
-    def upload_file_from_url(self, url, file_name, *, dir_name=''):
+    async def upload_file_from_url(self, url, file_name, *, dir_name='',
+                                   biz_attr='', replace=True, timeout=None,
+                                   max_size=None,
+                                   slice_threshold=SLICE_THRESHOLD,
+                                   slice_size=SLICE_SIZE):
         """
-        从 url 抓取文件并上传
-        （使用简单上传文件接口）
+        从 url 抓取文件并上传，边下载边上传
 
-        :param url: 文件url地址
-        :param file_name: 文件名称
-        :param dir_name: 文件夹名称（可选）
+        参数同 :meth:`CosBucket.upload_file_from_url`，
+        timeout 也可以是 ``aiohttp.ClientTimeout``
         """
+        if timeout is None:
+            timeout = self._download_timeout()
+        elif not isinstance(timeout, aiohttp.ClientTimeout):
+            if not isinstance(timeout, tuple):
+                timeout = (timeout, timeout)
+            timeout = aiohttp.ClientTimeout(sock_connect=timeout[0],
+                                            sock_read=timeout[1])
         try:
-            r = requests.get(url)
-            r.raise_for_status()
-        except:
+            r = await self.session.get(url, timeout=timeout,
+                                       headers={'Accept-Encoding': 'identity'})
+        except (aiohttp.ClientError, asyncio.TimeoutError):
             return {'error': 'download file failed'}
-        return self.upload_file(
-            BytesIO(r.content), file_name, dir_name=dir_name,
-            mime=r.headers.get('content-type')
+        async with r:
+            if not r.ok:
+                return {'error': 'download file failed'}
+            size = r.content_length
+            reader = _AsyncSourceReader(
+                r.content.iter_chunked(UPLOAD_CHUNK_SIZE), size, max_size
+            )
+            if size is not None and max_size is not None and size > max_size:
+                return {'error': 'file too large'}
+            try:
+                return await self._upload_from_reader(
+                    reader, file_name, dir_name, biz_attr, replace,
+                    r.headers.get('Content-Type') or 'application/octet-stream',
+                    slice_threshold, slice_size
+                )
+            except Exception:
+                if reader.error is None:
+                    raise
+                return _fetch_error(reader)
+
+    async def _upload_from_reader(self, reader, file_name, dir_name, biz_attr,
+                                  replace, mime, slice_threshold, slice_size):
+        if reader.size is None:
+            head = await reader.read(slice_threshold + 1)
+            if len(head) <= slice_threshold:
+                return await self.upload_file(
+                    BytesIO(head), file_name, dir_name=dir_name,
+                    biz_attr=biz_attr, replace=replace, mime=mime
+                )
+            with tempfile.NamedTemporaryFile() as f:
+                f.write(head)
+                del head
+                while True:
+                    chunk = await reader.read(UPLOAD_CHUNK_SIZE)
+                    if not chunk:
+                        break
+                    f.write(chunk)
+                f.flush()
+                return await self.upload_slice_file(
+                    f.name, slice_size, file_name, dir_name=dir_name,
+                    biz_attr=biz_attr, replace=replace
+                )
+
+        if reader.size <= slice_threshold:
+            return await self.upload_file(
+                reader, file_name, dir_name=dir_name, biz_attr=biz_attr,
+                replace=replace, mime=mime, size=reader.size
+            )
+        return await self._upload_slices_from_reader(
+            reader, file_name, dir_name, biz_attr, replace, slice_size
         )
 
-    def get_file(self, file_path):
+    async def _upload_slices_from_reader(self, reader, file_name, dir_name,
+                                         biz_attr, replace, slice_size):
+        url = self._upload_url(file_name, dir_name)
+        session = (await self._upload_slice_control(
+            url, file_size=reader.size, slice_size=slice_size,
+            biz_attr=biz_attr, replace=replace
+        ))['session']
+        for offset in range(0, reader.size, slice_size):
+            content = await reader.read(slice_size)
+            await self._upload_slice_data(url, filecontent=content,
+                                          session=session, offset=offset)
+        with self._invalidating((dir_name or '') + '/' + file_name):
+            return await self._upload_slice_finish(url, session=session,
+                                                   file_size=reader.size)
+
+    async def put(self, source, remote_path, *, biz_attr='', replace=True,
+                  mime='application/octet-stream', config=None):
+        """
+        上传文件，自动选择上传方式，参数同 :meth:`CosBucket.put`。
+        分片总是按顺序上传，类文件对象的 read 方法也可以是协程
+        """
+        config = config or self.transfer_config
+        dir_name, _, file_name = normalize_path(remote_path).rpartition('/')
+        size = _source_size(source)
+        plan = plan_transfer(size, config, self.throughput.value)
+        start = time.monotonic()
+        res = await self._put(source, size, plan, config, file_name, dir_name,
+                              biz_attr, replace, mime)
+        if size is not None and _put_succeeded(res):
+            self.throughput.record(size, time.monotonic() - start)
+        return res
+
+    async def _put(self, source, size, plan, config, file_name, dir_name,
+                   biz_attr, replace, mime):
+        if isinstance(source, (str, os.PathLike)):
+            if plan.method == 'simple':
+                with open(source, 'rb') as f:
+                    return await self.upload_file(
+                        f, file_name, dir_name=dir_name, biz_attr=biz_attr,
+                        replace=replace, mime=mime
+                    )
+            return await self.upload_slice_file(
+                os.fspath(source), plan.slice_size, file_name,
+                dir_name=dir_name, biz_attr=biz_attr, replace=replace
+            )
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            source = BytesIO(source)
+        if plan.method == 'simple':
+            return await self.upload_file(
+                source, file_name, dir_name=dir_name, biz_attr=biz_attr,
+                replace=replace, mime=mime, size=size
+            )
+
+        async def chunks():
+            while True:
+                chunk = source.read(UPLOAD_CHUNK_SIZE)
+                if asyncio.iscoroutine(chunk):
+                    chunk = await chunk
+                if not chunk:
+                    break
+                yield chunk
+
+        reader = _AsyncSourceReader(chunks(), size, None)
+        if size is None:
+            return await self._upload_from_reader(
+                reader, file_name, dir_name, biz_attr, replace, mime,
+                config.simple_threshold, plan.slice_size
+            )
+        return await self._upload_slices_from_reader(
+            reader, file_name, dir_name, biz_attr, replace, plan.slice_size
+        )
+
+    async def get_file(self, file_path):
         """
         :param file_path: 文件路径
         """
-        url = self._format_url(
-            '/files/v2/{app_id}/{bucket}/' + file_path
+        url, headers = self._download_req(file_path)
+
+        async def fetch():
+            with self._observing('get_file') as probe:
+                sent_at = time.monotonic()
+                async with self.session.get(
+                        url, headers=headers,
+                        timeout=self._download_timeout()) as resp:
+                    probe.response(resp.status, 0, time.monotonic() - sent_at)
+                    content = await resp.read()
+                    probe.bytes_received = len(content)
+                    return content
+
+        return await self._single_flight(
+            'get_file', file_path, lambda: self._hedged('get_file', fetch)
         )
-        headers = {
-            'Authorization': self.signer.sign_download(
-                self.config.bucket, file_path, 30
-            )
-        }
-        return requests.get(url, headers=headers).content
 
-    def move_file(self, source_file_path, dest_file_path):
+    async def iter_file(self, file_path, *, chunk_size=DOWNLOAD_CHUNK_SIZE):
         """
-        `移动文件 <https://cloud.tencent.com/document/product/436/6730>`_
+        流式下载文件，参数同 :meth:`CosBucket.iter_file`
+        """
+        url, headers = self._download_req(file_path)
+        with self._observing('get_file') as probe:
+            sent_at = time.monotonic()
+            async with self.session.get(
+                    url, headers=headers,
+                    timeout=self._download_timeout()) as resp:
+                probe.response(resp.status, 0, time.monotonic() - sent_at)
+                resp.raise_for_status()
+                async for chunk in resp.content.iter_chunked(chunk_size):
+                    probe.bytes_received += len(chunk)
+                    yield chunk
 
-        :param source_file_path: 源文件路径
-        :param dest_file_path: 目标路径
+    async def _download_range(self, file_path, tmp_path, start, end,
+                              chunk_size):
+        """
+        同 :meth:`CosBucket._download_range`
+        """
+        self.retry_budget.deposit()
+        with self._observing('get_file') as probe:
+            while True:
+                url, headers = self._download_req(file_path)
+                probe.sign_time += take_sign_time()
+                headers['Range'] = 'bytes=%d-%d' % (start, end)
+                sent_at = time.monotonic()
+                try:
+                    async with self.session.get(
+                            url, headers=headers,
+                            timeout=self._download_timeout()) as resp:
+                        probe.response(resp.status, 0,
+                                       time.monotonic() - sent_at)
+                        if resp.status == 200:
+                            # 忽略了 Range 头，重试也只会得到整个文件
+                            return None
+                        if resp.status != 206:
+                            resp.raise_for_status()
+                            raise ValueError('Unexpected status %d'
+                                             % resp.status)
+                        with open(tmp_path, 'r+b') as f:
+                            f.seek(start)
+                            written = 0
+                            async for chunk in resp.content.iter_chunked(
+                                    chunk_size):
+                                written += f.write(chunk)
+                        probe.bytes_received += written
+                    if written == end - start + 1:
+                        return written
+                except (aiohttp.ClientError, asyncio.TimeoutError,
+                        ValueError):
+                    pass
+                delay = self._retry_delay(probe.retries + 1, None)
+                if delay is None:
+                    break
+                probe.retries += 1
+                await asyncio.sleep(delay)
+            raise Exception('Download failed for %s bytes %d-%d'
+                            % (file_path, start, end))
 
-        注意:
-            目标路径若不以 / 开头，则认为是相对路径
+    async def download_to_file(self, file_path, local_path, *,
+                               chunk_size=DOWNLOAD_CHUNK_SIZE, max_workers=1,
+                               part_size=DOWNLOAD_PART_SIZE):
+        """
+        流式下载文件到本地，参数同 :meth:`CosBucket.download_to_file`，
+        ``max_workers`` 为同时进行的 Range 请求数
+        """
+        if max_workers > 1:
+            res = await self.stat_file(file_path)
+            if res['code'] != 0:
+                raise Exception('Stat file failed for %s: %s'
+                                % (file_path, res))
+            file_size = res['data']['filesize']
+            semaphore = asyncio.Semaphore(max_workers)
+
+            async def download(start, end):
+                async with semaphore:
+                    return await self._download_range(
+                        file_path, tmp_path, start, end, chunk_size
+                    )
+
+            with _atomic_path(local_path) as tmp_path:
+                with open(tmp_path, 'wb') as f:
+                    f.truncate(file_size)
+                tasks = [asyncio.ensure_future(download(start, end))
+                         for start, end in _split_ranges(file_size, part_size)]
+                try:
+                    sizes = await asyncio.gather(*tasks)
+                except BaseException:
+                    for task in tasks:
+                        task.cancel()
+                    raise
+                if None not in sizes:
+                    return sum(sizes)
+                # 服务端不支持 Range 时改为单个流下载
+                return await self._stream_to_file(file_path, tmp_path,
+                                                  chunk_size)
+
+        with _atomic_path(local_path) as tmp_path:
+            return await self._stream_to_file(file_path, tmp_path,
+                                              chunk_size)
+
+    async def _stream_to_file(self, file_path, tmp_path, chunk_size):
+        size = 0
+        with open(tmp_path, 'wb') as f:
+            async for chunk in self.iter_file(file_path,
+                                              chunk_size=chunk_size):
+                size += f.write(chunk)
+        return size
+
+    async def move_file(self, source_file_path, dest_file_path):
+        """
+        `移动文件 <https://cloud.tencent.com/document/product/436/6730>`_
+
+        参数同 :meth:`CosBucket.move_file`
         """
         url = self._format_url(
             '/files/v2/{app_id}/{bucket}/' + source_file_path
@@ -367,23 +2684,18 @@ class CosBucket(object):
                 self.config.bucket, source_file_path
             )
         }
-        return self._req(
-            'post', url,
-            data={'op': 'move', 'dest_fileid': dest_file_path,
-                  'to_over_write': '0'},
-            files={'filecontent': ('', '', 'application/octet-stream')},
-            headers=headers
-        )
+        writer = _build_form({'op': 'move', 'dest_fileid': dest_file_path,
+                              'to_over_write': '0'}, b'')
+        dest = self._dest_path(source_file_path, dest_file_path)
+        with self._invalidating(source_file_path, dest):
+            return await self._req('post', url, data=writer, headers=headers,
+                                   op='move_file')
 
-    def copy_file(self, source_file_path, dest_file_path):
+    async def copy_file(self, source_file_path, dest_file_path):
         """
         `拷贝文件 <https://www.qcloud.com/document/product/436/7419>`_
 
-        :param source_file_path: 源文件路径
-        :param dest_file_path: 目标路径
-
-        注意:
-            目标路径若不以 / 开头，则认为是相对路径
+        参数同 :meth:`CosBucket.copy_file`
         """
         url = self._format_url(
             '/files/v2/{app_id}/{bucket}/' + source_file_path
@@ -393,15 +2705,14 @@ class CosBucket(object):
                 self.config.bucket, source_file_path
             )
         }
-        return self._req(
-            'post', url,
-            data={'op': 'copy', 'dest_fileid': dest_file_path,
-                  'to_over_write': '0'},
-            files={'filecontent': ('', '', 'application/octet-stream')},
-            headers=headers
-        )
+        writer = _build_form({'op': 'copy', 'dest_fileid': dest_file_path,
+                              'to_over_write': '0'}, b'')
+        dest = self._dest_path(source_file_path, dest_file_path)
+        with self._invalidating(dest):
+            return await self._req('post', url, data=writer, headers=headers,
+                                   op='copy_file')
 
-    def delete_file(self, file_path):
+    async def delete_file(self, file_path):
         """
         `删除文件 <https://www.qcloud.com/document/product/436/6073>`_
 
@@ -414,9 +2725,11 @@ class CosBucket(object):
         headers = {
             'Authorization': self.signer.sign_once(self.config.bucket, file_path)
         }
-        return self._req('post', url, json={'op': 'delete'}, headers=headers)
+        with self._invalidating(file_path):
+            return await self._req('post', url, json={'op': 'delete'},
+                                   headers=headers, op='delete_file')
 
-    def stat_file(self, file_path):
+    async def stat_file(self, file_path):
         """
         `查询文件属性 <https://www.qcloud.com/document/api/436/6069>`_
 
@@ -427,27 +2740,25 @@ class CosBucket(object):
             file_path=file_path
         )
         headers = {
-            'Content-Type': 'application/json',
-            'Authorization': self.signer.sign_more(self.config.bucket, '', 30)
+            'Authorization': self._sign_more()
         }
-        return self._req('get', url, headers=headers)
 
-    def update_file_status(self, file_path, *, authority='eInvalid',
-                           custom_headers=None):
+        def fetch():
+            return self._hedged('stat_file', lambda: self._req(
+                'get', url, headers=headers, op='stat_file'
+            ))
+
+        return await self._single_flight('stat_file', file_path, fetch)
+
+    async def update_file_status(self, file_path, *, authority='eInvalid',
+                                 custom_headers=None):
         """
         `修改文件属性 <https://www.qcloud.com/document/api/436/6072>`_
 
-        :param file_path: 文件路径
-        :param authority: 文件权限
-        :param custom_headers: 自定义文件头信息
-        :type authority: eInvalid / eWRPrivate / eWPrivateRPublic
+        参数同 :meth:`CosBucket.update_file_status`
         """
         file_path = file_path.lstrip('/')
-        assert authority in (
-            'eInvalid', # 空权限，此时系统会默认调取 Bucket 权限
-            'eWRPrivate', # 私有读写
-            'eWPrivateRPublic' # 公有读私有写
-        )
+        assert authority in ('eInvalid', 'eWRPrivate', 'eWPrivateRPublic')
 
         url = self._format_url(
             '/files/v2/{app_id}/{bucket}/' + file_path
@@ -460,4 +2771,6 @@ class CosBucket(object):
             'authority': authority,
             'custom_headers': custom_headers or {}
         }
-        return self._req('post', url, json=payload, headers=headers)
+        with self._invalidating(file_path):
+            return await self._req('post', url, json=payload, headers=headers,
+                                   op='update_file_status')
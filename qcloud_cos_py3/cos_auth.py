@@ -5,11 +5,85 @@ import binascii
 import urllib
 import hashlib
 import hmac
+import threading
+from contextvars import ContextVar
+from functools import wraps
+
+
+SIGN_CACHE_MARGIN = 5
+SIGN_CACHE_SIZE = 1024
+
+# 当前线程 / 协程自上次取出以来签名所花的时间
+_sign_time = ContextVar('cos_sign_time', default=0.0)
+
+
+def take_sign_time():
+    """
+    取出并清零当前线程 / 协程累计的签名耗时，单位为秒
+    """
+    elapsed = _sign_time.get()
+    _sign_time.set(0.0)
+    return elapsed
+
+
+def add_sign_time(elapsed):
+    """
+    把在其他线程 / 协程中签名的耗时计入当前线程 / 协程
+    """
+    _sign_time.set(_sign_time.get() + elapsed)
+
+
+def _timed(func):
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        start = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            add_sign_time(time.perf_counter() - start)
+    return wrapper
 
 
 class CosAuth(object):
-    def __init__(self, config):
+    """
+    COS 签名
+
+    多次签名和下载签名按 (bucket, 路径, 类型, 有效期) 缓存，
+    在过期前 ``cache_margin`` 秒重新生成；单次签名不缓存
+
+    :param config: CosConfig
+    :param cache: 是否缓存签名（可选），默认为 True
+    :param cache_margin: 提前刷新缓存签名的秒数（可选），默认为 5 秒
+    """
+
+    def __init__(self, config, *, cache=True, cache_margin=SIGN_CACHE_MARGIN):
         self.config = config
+        self.cache = cache
+        self.cache_margin = cache_margin
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def _cached_sign(self, kind, bucket, cos_path, expired, upload_sign):
+        if not self.cache or expired == 0:
+            return self.app_sign(bucket, cos_path, expired, upload_sign)
+        key = (bucket, cos_path, kind, expired)
+        now = int(time.time())
+        with self._lock:
+            cached = self._cache.get(key)
+        if cached is not None and now < cached[1]:
+            return cached[0]
+
+        expired_at = expired if expired >= now else now + expired
+        margin = min(self.cache_margin, (expired_at - now) // 2)
+        sign = self.app_sign(bucket, cos_path, expired_at, upload_sign)
+        with self._lock:
+            if len(self._cache) >= SIGN_CACHE_SIZE:
+                self._cache = {k: v for k, v in self._cache.items()
+                               if now < v[1]}
+                if len(self._cache) >= SIGN_CACHE_SIZE:
+                    self._cache.clear()
+            self._cache[key] = (sign, expired_at - margin)
+        return sign
 
     def app_sign(self, bucket, cos_path, expired, upload_sign=True):
         appid = self.config.app_id
@@ -37,6 +111,7 @@ class CosAuth(object):
         sign_base64 = base64.b64encode(sign_hex)
         return sign_base64.decode('utf8')
 
+    @_timed
     def sign_once(self, bucket, cos_path):
         """单次签名(针对删除和更新操作)
 
@@ -46,6 +121,7 @@ class CosAuth(object):
         """
         return self.app_sign(bucket, cos_path, 0)
 
+    @_timed
     def sign_more(self, bucket, cos_path, expired):
         """多次签名(针对上传文件，创建目录, 获取文件目录属性, 拉取目录列表)
 
@@ -54,8 +130,9 @@ class CosAuth(object):
         :param expired: 签名过期时间, UNIX时间戳, 如想让签名在30秒后过期, 即可将expired设成当前时间加上30秒
         :return: 签名字符串
         """
-        return self.app_sign(bucket, cos_path, expired)
+        return self._cached_sign('more', bucket, cos_path, expired, True)
 
+    @_timed
     def sign_download(self, bucket, cos_path, expired):
         """下载签名(用于获取后拼接成下载链接，下载私有bucket的文件)
 
@@ -64,4 +141,4 @@ class CosAuth(object):
         :param expired:  签名过期时间, UNIX时间戳, 如想让签名在30秒后过期, 即可将expired设成当前时间加上30秒
         :return: 签名字符串
         """
-        return self.app_sign(bucket, cos_path, expired, False)
+        return self._cached_sign('download', bucket, cos_path, expired, False)
@@ -0,0 +1,127 @@
+import asyncio
+import threading
+import time
+from collections import deque
+from concurrent.futures import wait, FIRST_COMPLETED
+
+
+HEDGE_WINDOW = 100
+HEDGE_MIN_SAMPLES = 20
+HEDGE_PERCENTILE = 95
+
+
+class LatencyTracker(object):
+    """
+    记录各操作最近的耗时，用于自动计算对冲请求的等待时间
+
+    :param window: 每个操作保留的最近耗时数
+    :param min_samples: 样本数不足时不发对冲请求
+    :param percentile: 等待时间取最近耗时的百分位数
+    """
+
+    def __init__(self, window=HEDGE_WINDOW, min_samples=HEDGE_MIN_SAMPLES,
+                 percentile=HEDGE_PERCENTILE):
+        self.window = window
+        self.min_samples = min_samples
+        self.percentile = percentile
+        self._samples = {}
+        self._lock = threading.Lock()
+
+    def record(self, op, latency):
+        with self._lock:
+            samples = self._samples.get(op)
+            if samples is None:
+                samples = self._samples[op] = deque(maxlen=self.window)
+            samples.append(latency)
+
+    def delay(self, op):
+        """
+        :return: 耗时的百分位数，样本不足时返回 None
+        """
+        with self._lock:
+            samples = sorted(self._samples.get(op, ()))
+        if len(samples) < self.min_samples:
+            return None
+        index = min(len(samples) - 1,
+                    len(samples) * self.percentile // 100)
+        return samples[index]
+
+
+def hedged_call(executor, fetch, delay, max_hedges, hedge_executor=None):
+    """
+    在线程池中执行 fetch，超过 delay 秒未返回时再发一个相同的请求，
+    最多再发 max_hedges 个，返回最先成功的结果。
+    全部失败时抛出第一个请求的异常
+
+    已经发出的 HTTP 请求无法中断，落后的请求完成后结果被丢弃
+
+    :param hedge_executor: 执行对冲请求的线程池（可选），默认与第一个请求
+      共用 executor。分开后对冲请求不会排在其他调用的第一个请求后面
+    """
+    if hedge_executor is None:
+        hedge_executor = executor
+    futures = [executor.submit(fetch)]
+    pending = set(futures)
+    while True:
+        timeout = delay if len(futures) <= max_hedges else None
+        done, pending = wait(pending, timeout=timeout,
+                             return_when=FIRST_COMPLETED)
+        for future in done:
+            if future.exception() is None:
+                for other in pending:
+                    other.cancel()
+                return future.result()
+        if not pending:
+            return futures[0].result()
+        if not done:
+            future = hedge_executor.submit(fetch)
+            futures.append(future)
+            pending.add(future)
+
+
+async def async_hedged_call(fetch, delay, max_hedges):
+    """
+    asyncio 版本的 :func:`hedged_call`，fetch 为返回协程的函数，
+    落后的请求会被取消
+    """
+    tasks = [asyncio.ensure_future(fetch())]
+    pending = set(tasks)
+    try:
+        while True:
+            timeout = delay if len(tasks) <= max_hedges else None
+            done, pending = await asyncio.wait(
+                pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                if task.exception() is None:
+                    return task.result()
+            if not pending:
+                return tasks[0].result()
+            if not done:
+                task = asyncio.ensure_future(fetch())
+                tasks.append(task)
+                pending.add(task)
+    finally:
+        for task in tasks:
+            task.cancel()
+
+
+def timed(tracker, op, fetch):
+    """
+    包装 fetch，成功时把耗时记入 tracker
+    """
+    def run():
+        start = time.monotonic()
+        res = fetch()
+        tracker.record(op, time.monotonic() - start)
+        return res
+    return run
+
+
+def async_timed(tracker, op, fetch):
+    async def run():
+        start = time.monotonic()
+        res = await fetch()
+        tracker.record(op, time.monotonic() - start)
+        return res
+    return run
@@ -0,0 +1,415 @@
+import asyncio
+import base64
+import hashlib
+import hmac
+import random
+import re
+import threading
+import time
+import urllib.parse
+import uuid
+
+from aiohttp import web
+
+
+MAX_BODY_SIZE = 1024 ** 3
+
+
+def _ok(data=None):
+    res = {'code': 0, 'message': 'SUCCESS', 'request_id': uuid.uuid4().hex}
+    if data is not None:
+        res['data'] = data
+    return web.json_response(res)
+
+
+def _err(code, message, status=200):
+    return web.json_response(
+        {'code': code, 'message': message, 'request_id': uuid.uuid4().hex},
+        status=status
+    )
+
+
+class LocalCosServer(object):
+    """
+    本地 COS 模拟服务，实现 :class:`~qcloud_cos_py3.CosBucket` 用到的
+    ``/files/v2/{app_id}/{bucket}/...`` 接口并校验签名，数据保存在内存中，
+    用于离线测试和性能测试::
+
+        with LocalCosServer(app_id, secret_id, secret_key, bucket) as server:
+            cos = CosBucket(app_id, secret_id, secret_key, bucket,
+                            endpoint=server.endpoint)
+
+    :param host: 监听地址（可选）
+    :param port: 监听端口（可选），默认为 0，即随机端口
+    :param latency: 每个请求附加的延迟，单位为秒（可选）
+    :param tail_latency: 长尾延迟，单位为秒（可选）
+    :param tail_rate: 请求附加长尾延迟的概率（可选）
+    :param slow_next: 接下来若干个请求一定附加长尾延迟（可选）
+    :param error_rate: 返回 HTTP 500 的概率（可选）
+    :param throttle_rate: 返回 -71 (操作过快) 的概率（可选）
+    :param dir_throttle_rate: 写操作返回 -143 (单目录写入过快) 的概率（可选）
+    :param max_dir_write_rate: 单个目录每秒最多写入次数（可选），
+      超出时返回 -143，默认不限制
+    :param serial_upload: 分片上传初始化时是否要求串行上传（可选）
+    :param range_requests: 是否支持 Range 下载（可选），默认为 True，
+      为 False 时忽略 Range 头，返回整个文件
+
+    以上注入参数可以在服务运行时直接修改
+    """
+
+    def __init__(self, app_id, secret_id, secret_key, bucket, *,
+                 host='127.0.0.1', port=0, latency=0, tail_latency=0,
+                 tail_rate=0, slow_next=0, error_rate=0,
+                 throttle_rate=0, dir_throttle_rate=0, max_dir_write_rate=None,
+                 serial_upload=False, range_requests=True):
+        self.app_id = str(app_id)
+        self.secret_id = secret_id
+        self.secret_key = secret_key
+        self.bucket = bucket
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.tail_latency = tail_latency
+        self.tail_rate = tail_rate
+        self.slow_next = slow_next
+        self.error_rate = error_rate
+        self.throttle_rate = throttle_rate
+        self.dir_throttle_rate = dir_throttle_rate
+        self.max_dir_write_rate = max_dir_write_rate
+        self.serial_upload = serial_upload
+        self.range_requests = range_requests
+        self._dir_writes = {}
+        self.files = {}
+        self.dirs = {}
+        self.sessions = {}
+        self.request_count = 0
+        self._loop = None
+        self._runner = None
+        self._thread = None
+
+    @property
+    def endpoint(self):
+        return 'http://%s:%d' % (self.host, self.port)
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def make_app(self):
+        app = web.Application(client_max_size=MAX_BODY_SIZE)
+        prefix = '/files/v2/%s/%s' % (self.app_id, self.bucket)
+        app.router.add_route('*', prefix + '{path:.*}', self._handle)
+        return app
+
+    def start(self):
+        """
+        在后台线程中启动服务
+        """
+        started = threading.Event()
+
+        def run():
+            self._loop = asyncio.new_event_loop()
+            asyncio.set_event_loop(self._loop)
+            self._runner = web.AppRunner(self.make_app())
+            self._loop.run_until_complete(self._runner.setup())
+            site = web.TCPSite(self._runner, self.host, self.port)
+            self._loop.run_until_complete(site.start())
+            self.port = site._server.sockets[0].getsockname()[1]
+            started.set()
+            self._loop.run_forever()
+            self._loop.run_until_complete(self._runner.cleanup())
+            self._loop.close()
+
+        self._thread = threading.Thread(target=run, daemon=True)
+        self._thread.start()
+        started.wait()
+
+    def stop(self):
+        """
+        停止服务
+        """
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+            self._thread.join()
+            self._loop = None
+
+    def _check_sign(self, request, path):
+        try:
+            raw = base64.b64decode(request.headers['Authorization'])
+            digest, plain_text = raw[:20], raw[20:]
+            fields = dict(urllib.parse.parse_qsl(
+                plain_text.decode('utf8'), keep_blank_values=True
+            ))
+        except Exception:
+            return False
+        expected = hmac.new(self.secret_key.encode('utf8'), plain_text,
+                            hashlib.sha1).digest()
+        if not hmac.compare_digest(digest, expected):
+            return False
+        if (fields.get('a') != self.app_id or
+                fields.get('k') != self.secret_id or
+                fields.get('b') != self.bucket):
+            return False
+        expired = int(fields.get('e', 0))
+        if expired == 0:
+            # 单次签名必须绑定到所操作的路径
+            fileid = '/%s/%s/%s' % (self.app_id, self.bucket,
+                                    urllib.parse.quote(path, '~/'))
+            return re.sub('/+', '/', fields.get('f', '')) == fileid
+        return expired >= int(time.time())
+
+    async def _handle(self, request):
+        self.request_count += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.slow_next > 0:
+            self.slow_next -= 1
+            await asyncio.sleep(self.tail_latency)
+        elif self.tail_rate and random.random() < self.tail_rate:
+            await asyncio.sleep(self.tail_latency)
+        if self.error_rate and random.random() < self.error_rate:
+            return web.Response(status=500, text='injected error')
+        if self.throttle_rate and random.random() < self.throttle_rate:
+            return _err(-71, 'ERROR_CMD_COS_OPERATING_TOO_FAST')
+
+        path = request.match_info['path'].lstrip('/')
+        if not self._check_sign(request, path):
+            return _err(-133, 'ERROR_CMD_COS_AUTH_FAIL', status=403)
+
+        if request.method == 'GET':
+            op = request.query.get('op')
+            if op == 'list':
+                return self._list(path, request.query)
+            if op == 'stat':
+                return self._stat(path)
+            return self._download(request, path)
+
+        if request.content_type == 'application/json':
+            form = await request.json()
+        else:
+            form = {}
+            reader = await request.multipart()
+            async for part in reader:
+                value = bytes(await part.read())
+                if part.name != 'filecontent':
+                    value = value.decode('utf8')
+                form[part.name] = value
+        if ((self.dir_throttle_rate and
+                random.random() < self.dir_throttle_rate) or
+                self._dir_write_too_fast(path)):
+            return _err(-143, 'ERROR_CMD_COS_WRITING_TOO_FAST_ON_SINGLE_DIR')
+
+        handler = getattr(self, '_op_' + str(form.get('op')), None)
+        if handler is None:
+            return _err(-2, 'ERROR_CMD_COS_INVALID_OP')
+        return handler(path, form)
+
+    def _dir_write_too_fast(self, path):
+        if self.max_dir_write_rate is None:
+            return False
+        dir_path = path.rstrip('/').rpartition('/')[0]
+        now = time.monotonic()
+        writes = [t for t in self._dir_writes.get(dir_path, ()) if t > now - 1]
+        if len(writes) >= self.max_dir_write_rate:
+            self._dir_writes[dir_path] = writes
+            return True
+        writes.append(now)
+        self._dir_writes[dir_path] = writes
+        return False
+
+    def _file_info(self, path):
+        f = self.files[path]
+        return {
+            'name': path.rsplit('/', 1)[-1],
+            'biz_attr': f['biz_attr'],
+            'filesize': len(f['content']),
+            'filelen': len(f['content']),
+            'sha': hashlib.sha1(f['content']).hexdigest(),
+            'ctime': f['ctime'],
+            'mtime': f['mtime'],
+            'authority': f['authority'],
+            'custom_headers': f['custom_headers'],
+            'access_url': '/' + path,
+        }
+
+    def _dir_info(self, path):
+        d = self.dirs.get(path, {'biz_attr': '', 'ctime': '', 'mtime': ''})
+        return {
+            'name': path.rstrip('/').rsplit('/', 1)[-1],
+            'biz_attr': d['biz_attr'],
+            'ctime': d['ctime'],
+            'mtime': d['mtime'],
+        }
+
+    def _resource(self, path):
+        return '/%s/%s/%s' % (self.app_id, self.bucket, path)
+
+    def _children(self, dir_path):
+        names = set()
+        for key in list(self.files) + list(self.dirs):
+            if key.startswith(dir_path) and key != dir_path:
+                rest = key[len(dir_path):]
+                if '/' in rest.rstrip('/'):
+                    names.add(rest.split('/', 1)[0] + '/')
+                else:
+                    names.add(rest)
+        return sorted(names)
+
+    def _list(self, path, query):
+        dir_path, _, prefix = path.rpartition('/')
+        dir_path = dir_path + '/' if dir_path else ''
+        num = int(query.get('num', 1000))
+        context = query.get('context') or ''
+        names = [n for n in self._children(dir_path) if n.startswith(prefix)]
+        if context:
+            names = [n for n in names if n > context]
+        elif dir_path in self.dirs:
+            # 真实存在的目录会占用一个名额
+            num -= 1
+        page, rest = names[:num], names[num:]
+        infos = []
+        for name in page:
+            key = dir_path + name
+            if name.endswith('/'):
+                infos.append(self._dir_info(key))
+            else:
+                infos.append(self._file_info(key))
+        return _ok({
+            'context': page[-1] if page and rest else '',
+            'listover': not rest,
+            'infos': infos,
+            'dircount': sum(1 for n in page if n.endswith('/')),
+            'filecount': sum(1 for n in page if not n.endswith('/')),
+        })
+
+    def _stat(self, path):
+        if path.endswith('/') or not path:
+            if path in self.dirs or self._children(path):
+                return _ok(self._dir_info(path))
+        elif path in self.files:
+            return _ok(self._file_info(path))
+        return _err(-197, 'ERROR_CMD_COS_INDEX_ERROR')
+
+    def _download(self, request, path):
+        if path not in self.files:
+            return web.Response(status=404)
+        content = self.files[path]['content']
+        headers = self.files[path]['custom_headers']
+        range_header = request.headers.get('Range')
+        if self.range_requests and range_header and \
+                range_header.startswith('bytes='):
+            start, _, end = range_header[6:].partition('-')
+            start = int(start)
+            end = min(int(end) if end else len(content) - 1, len(content) - 1)
+            headers = dict(headers)
+            headers['Content-Range'] = 'bytes %d-%d/%d' % (
+                start, end, len(content))
+            return web.Response(status=206, body=content[start:end + 1],
+                                headers=headers)
+        return web.Response(body=content, headers=headers)
+
+    def _put_file(self, path, content, biz_attr, insert_only):
+        if insert_only == '1' and path in self.files:
+            return _err(-4018, 'ERROR_PROXY_FILE_EXIST')
+        now = str(int(time.time()))
+        old = self.files.get(path)
+        self.files[path] = {
+            'content': content,
+            'biz_attr': biz_attr or '',
+            'ctime': old['ctime'] if old else now,
+            'mtime': now,
+            'authority': 'eInvalid',
+            'custom_headers': {},
+        }
+        return _ok({
+            'access_url': '/' + path,
+            'resource_path': self._resource(path),
+            'source_url': '/' + path,
+            'url': '/' + path,
+        })
+
+    def _op_create(self, path, form):
+        if path in self.dirs:
+            return _err(-178, 'ERROR_CMD_COS_PATH_CONFLICT')
+        now = str(int(time.time()))
+        self.dirs[path] = {'biz_attr': form.get('biz_attr', ''),
+                           'ctime': now, 'mtime': now}
+        return _ok({'ctime': now, 'resource_path': self._resource(path)})
+
+    def _op_delete(self, path, form):
+        if path.endswith('/'):
+            if self.dirs.pop(path, None) is None:
+                return _err(-197, 'ERROR_CMD_COS_INDEX_ERROR')
+        elif self.files.pop(path, None) is None:
+            return _err(-197, 'ERROR_CMD_COS_INDEX_ERROR')
+        return _ok()
+
+    def _op_upload(self, path, form):
+        return self._put_file(path, form.get('filecontent', b''),
+                              form.get('biz_attr'), form.get('insertOnly'))
+
+    def _op_upload_slice_init(self, path, form):
+        if form.get('insertOnly') == '1' and path in self.files:
+            return _err(-4018, 'ERROR_PROXY_FILE_EXIST')
+        session = uuid.uuid4().hex
+        self.sessions[session] = {
+            'path': path,
+            'filesize': int(form['filesize']),
+            'slice_size': int(form['slice_size']),
+            'biz_attr': form.get('biz_attr', ''),
+            'insertOnly': form.get('insertOnly'),
+            'sha': form.get('sha'),
+            'parts': {},
+        }
+        return _ok({'session': session,
+                    'slice_size': int(form['slice_size']),
+                    'serial_upload': int(self.serial_upload)})
+
+    def _op_upload_slice_data(self, path, form):
+        s = self.sessions.get(form.get('session'))
+        if s is None or s['path'] != path:
+            return _err(-4019, 'ERROR_PROXY_SESSION_INVALID')
+        offset = int(form['offset'])
+        s['parts'][offset] = form['filecontent']
+        return _ok({'session': form['session'], 'offset': offset})
+
+    def _op_upload_slice_finish(self, path, form):
+        s = self.sessions.get(form.get('session'))
+        if s is None or s['path'] != path:
+            return _err(-4019, 'ERROR_PROXY_SESSION_INVALID')
+        content = b''.join(s['parts'][k] for k in sorted(s['parts']))
+        if len(content) != s['filesize']:
+            return _err(-4020, 'ERROR_PROXY_SLICE_INCOMPLETE')
+        if s['sha'] and s['sha'] != hashlib.sha1(content).hexdigest():
+            return _err(-4021, 'ERROR_PROXY_SHA_MISMATCH')
+        del self.sessions[form['session']]
+        return self._put_file(path, content, s['biz_attr'], s['insertOnly'])
+
+    def _dest_path(self, path, dest):
+        if dest.startswith('/'):
+            return dest.lstrip('/')
+        return path.rpartition('/')[0] + '/' + dest if '/' in path else dest
+
+    def _op_move(self, path, form, keep=False):
+        if path not in self.files:
+            return _err(-197, 'ERROR_CMD_COS_INDEX_ERROR')
+        dest = self._dest_path(path, form['dest_fileid'])
+        if dest in self.files and form.get('to_over_write') != '1':
+            return _err(-4018, 'ERROR_PROXY_FILE_EXIST')
+        entry = self.files[path] if keep else self.files.pop(path)
+        self.files[dest] = dict(entry)
+        return _ok()
+
+    def _op_copy(self, path, form):
+        return self._op_move(path, form, keep=True)
+
+    def _op_update(self, path, form):
+        if path not in self.files:
+            return _err(-197, 'ERROR_CMD_COS_INDEX_ERROR')
+        f = self.files[path]
+        f['authority'] = form.get('authority', f['authority'])
+        f['custom_headers'] = form.get('custom_headers') or {}
+        return _ok()
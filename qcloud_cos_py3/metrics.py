@@ -0,0 +1,198 @@
+import bisect
+import threading
+import time
+from collections import namedtuple, Counter
+
+
+RequestEvent = namedtuple(
+    'RequestEvent',
+    ['op', 'code', 'status', 'latency', 'ttfb', 'sign_time', 'bytes_sent',
+     'bytes_received', 'retries', 'throttles', 'error']
+)
+RequestEvent.__doc__ = """
+一次 API 调用（包括所有重试）的统计
+
+:param op: 操作名，如 ``stat_file``
+:param code: COS 返回码，下载请求为 None
+:param status: 最后一次响应的 HTTP 状态码，没有响应时为 None
+:param latency: 总耗时，包括限速等待和重试，单位为秒
+:param ttfb: 最后一次响应的首字节时间，单位为秒
+:param sign_time: 签名耗时，单位为秒
+:param bytes_sent: 发送的请求体字节数
+:param bytes_received: 接收的响应体字节数
+:param retries: 网络错误重试次数
+:param throttles: 被限流 (-71 / -143) 的次数
+:param error: 调用失败时的异常，成功时为 None
+"""
+
+# 秒
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1, 2.5, 5, 10, 30, 60)
+
+
+class RequestProbe(object):
+    """
+    在调用过程中收集统计，结束时生成 :class:`RequestEvent`
+    """
+
+    def __init__(self, op, sign_time):
+        self.op = op
+        self.sign_time = sign_time
+        self.start = time.monotonic()
+        self.code = self.status = self.ttfb = self.error = None
+        self.bytes_sent = self.bytes_received = 0
+        self.retries = self.throttles = 0
+
+    def response(self, status, bytes_sent, ttfb):
+        self.status = status
+        self.bytes_sent += int(bytes_sent or 0)
+        self.ttfb = ttfb
+
+    def event(self):
+        return RequestEvent(
+            self.op, self.code, self.status, time.monotonic() - self.start,
+            self.ttfb, self.sign_time, self.bytes_sent, self.bytes_received,
+            self.retries, self.throttles, self.error
+        )
+
+
+class Observer(object):
+    """
+    请求观察者接口，通过 ``observers`` 参数传给 :class:`CosBucket`
+    或 :class:`AsyncCosBucket`，每次 API 调用结束时收到一个
+    :class:`RequestEvent`。
+
+    :meth:`on_request` 在发出请求的线程或事件循环中同步调用，应尽快返回；
+    它抛出的异常会被忽略
+    """
+
+    def on_request(self, event):
+        pass
+
+
+class Histogram(object):
+    """
+    固定分桶的直方图
+
+    :param buckets: 各桶的上限，升序
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, q):
+        """
+        估算百分位数，返回所在桶的上限，落在最后一个桶时返回 inf
+
+        :param q: 0 ~ 100
+        """
+        if not self.count:
+            return None
+        rank = self.count * q / 100
+        seen = 0
+        for bound, count in zip(self.buckets, self.counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        """
+        :return: ``{'buckets': [(上限, 累计数), ...], 'count': 总数, 'sum': 总和}``，
+          与 Prometheus histogram 的格式一致
+        """
+        cumulative = []
+        seen = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self.counts):
+            seen += count
+            cumulative.append((bound, seen))
+        return {'buckets': cumulative, 'count': self.count, 'sum': self.sum}
+
+
+class _OpStats(object):
+
+    def __init__(self, buckets):
+        self.latency = Histogram(buckets)
+        self.ttfb = Histogram(buckets)
+        self.errors = 0
+        self.retries = 0
+        self.throttles = 0
+        self.bytes_sent = 0
+        self.bytes_received = 0
+        self.sign_time = 0.0
+        self.codes = Counter()
+
+    def snapshot(self):
+        return {
+            'latency': self.latency.snapshot(),
+            'ttfb': self.ttfb.snapshot(),
+            'errors': self.errors,
+            'retries': self.retries,
+            'throttles': self.throttles,
+            'bytes_sent': self.bytes_sent,
+            'bytes_received': self.bytes_received,
+            'sign_time': self.sign_time,
+            'codes': dict(self.codes),
+        }
+
+
+class MetricsAggregator(Observer):
+    """
+    内存中的统计汇总，按操作名记录耗时和首字节时间的直方图，
+    以及错误、重试、限流次数和收发字节数
+
+    :param buckets: 直方图各桶的上限（可选），单位为秒
+    """
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self._ops = {}
+        self._lock = threading.Lock()
+
+    def on_request(self, event):
+        with self._lock:
+            stats = self._ops.get(event.op)
+            if stats is None:
+                stats = self._ops[event.op] = _OpStats(self.buckets)
+            stats.latency.observe(event.latency)
+            if event.ttfb is not None:
+                stats.ttfb.observe(event.ttfb)
+            if event.error is not None:
+                stats.errors += 1
+            if event.code is not None:
+                stats.codes[event.code] += 1
+            stats.retries += event.retries
+            stats.throttles += event.throttles
+            stats.bytes_sent += event.bytes_sent
+            stats.bytes_received += event.bytes_received
+            stats.sign_time += event.sign_time
+
+    def percentile(self, op, q):
+        """
+        某操作耗时的百分位数估计，没有数据时返回 None
+
+        :param op: 操作名
+        :param q: 0 ~ 100
+        """
+        with self._lock:
+            stats = self._ops.get(op)
+            return stats.latency.percentile(q) if stats else None
+
+    def snapshot(self):
+        """
+        :return: ``{操作名: 统计}``，可用于导出到 Prometheus 等监控系统
+        """
+        with self._lock:
+            return {op: stats.snapshot() for op, stats in self._ops.items()}
+
+    def reset(self):
+        with self._lock:
+            self._ops.clear()
@@ -0,0 +1,166 @@
+import asyncio
+import threading
+import time
+
+
+MAX_RATE = 1000
+DIR_MAX_RATE = 200
+MIN_RATE = 1
+RATE_INCREASE = 10
+RATE_DECREASE = 0.5
+DECREASE_COOLDOWN = 0.5
+MAX_DIRS = 1024
+
+# Operating too fast
+CODE_TOO_FAST = -71
+# Writing too fast on a single dir
+CODE_DIR_TOO_FAST = -143
+THROTTLE_CODES = (CODE_TOO_FAST, CODE_DIR_TOO_FAST)
+
+
+class _AdaptiveBucket(object):
+    """
+    速率可调的令牌桶，桶容量为一秒的令牌数
+    """
+
+    def __init__(self, rate, min_rate, max_rate):
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.tokens = rate
+        self.updated = time.monotonic()
+        self.decreased = 0
+
+    def refill(self, now):
+        self.tokens = min(max(self.rate, 1),
+                          self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def decrease(self, now, factor, cooldown, sent_at=None):
+        # 同一轮限流只降一次速；降速后才发出的请求仍被限流时继续降速
+        if now - self.decreased < cooldown and \
+                (sent_at is None or sent_at < self.decreased):
+            return
+        self.decreased = now
+        self.rate = max(self.min_rate, self.rate * factor)
+        self.tokens = min(self.tokens, 0)
+
+    def increase(self, step):
+        # 每秒约增加 step 个请求
+        self.rate = min(self.max_rate, self.rate + step / self.rate)
+
+
+class RateLimiter(object):
+    """
+    AIMD 自适应限速器，分别限制整个 bucket 和单个目录的写入速率
+
+    每个请求发出前调用 :meth:`acquire`。
+    COS 返回 -71 时 bucket 速率减半，返回 -143 时该目录的写入速率减半；
+    请求成功时速率逐步回升，直到上限
+
+    :param max_rate: bucket 的最大请求速率（次/秒），默认为 1000
+    :param dir_max_rate: 单个目录的最大写入速率（次/秒），默认为 200
+    :param min_rate: 最小速率（次/秒），默认为 1
+    :param increase: 每秒回升的速率（次/秒），默认为 10
+    :param decrease: 被限流时速率乘以的系数，默认为 0.5
+    :param cooldown: 两次降速的最小间隔，单位为秒，默认为 0.5。
+      降速后才发出的请求不受此限制
+    """
+
+    def __init__(self, *, max_rate=MAX_RATE, dir_max_rate=DIR_MAX_RATE,
+                 min_rate=MIN_RATE, increase=RATE_INCREASE,
+                 decrease=RATE_DECREASE, cooldown=DECREASE_COOLDOWN):
+        self.min_rate = min_rate
+        self.dir_max_rate = dir_max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.cooldown = cooldown
+        self._bucket = _AdaptiveBucket(max_rate, min_rate, max_rate)
+        self._dirs = {}
+        self._lock = threading.Lock()
+
+    def _dir_bucket(self, dir_name):
+        bucket = self._dirs.get(dir_name)
+        if bucket is None:
+            if len(self._dirs) >= MAX_DIRS:
+                # 已恢复到最大速率的目录与新目录无异，可以丢弃
+                self._dirs = {k: v for k, v in self._dirs.items()
+                              if v.rate < v.max_rate}
+            bucket = self._dirs[dir_name] = _AdaptiveBucket(
+                self.dir_max_rate, self.min_rate, self.dir_max_rate
+            )
+        return bucket
+
+    def _try_acquire(self, dir_name):
+        """
+        取得令牌时返回 0，否则返回需要等待的时间。
+        不预支令牌，这样降速后正在等待的请求也按新速率发出
+        """
+        with self._lock:
+            now = time.monotonic()
+            buckets = [self._bucket]
+            if dir_name is not None:
+                buckets.append(self._dir_bucket(dir_name))
+            wait = max(bucket.refill(now) for bucket in buckets)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket.tokens -= 1
+            return wait
+
+    def acquire(self, dir_name=None):
+        """
+        等待直到可以发出请求
+
+        :param dir_name: 写操作所在的目录（可选），读操作不需要
+        """
+        while True:
+            wait = self._try_acquire(dir_name)
+            if not wait:
+                return
+            time.sleep(wait)
+
+    def feedback(self, code, dir_name=None, sent_at=None):
+        """
+        根据 COS 返回码调整速率
+
+        :param code: COS 返回码
+        :param dir_name: 写操作所在的目录（可选）
+        :param sent_at: 请求发出的时间（可选），``time.monotonic()`` 的值
+        """
+        with self._lock:
+            now = time.monotonic()
+            if code == CODE_DIR_TOO_FAST and dir_name is not None:
+                self._dir_bucket(dir_name).decrease(now, self.decrease,
+                                                    self.cooldown, sent_at)
+            elif code in THROTTLE_CODES:
+                self._bucket.decrease(now, self.decrease, self.cooldown,
+                                      sent_at)
+            else:
+                self._bucket.increase(self.increase)
+                if dir_name is not None and dir_name in self._dirs:
+                    self._dirs[dir_name].increase(self.increase)
+
+    def rate(self, dir_name=None):
+        """
+        当前速率（次/秒）
+
+        :param dir_name: 目录（可选），默认返回 bucket 的速率
+        """
+        with self._lock:
+            if dir_name is None:
+                return self._bucket.rate
+            return min(self._bucket.rate, self._dir_bucket(dir_name).rate)
+
+
+class AsyncRateLimiter(RateLimiter):
+    """
+    asyncio 版本的 :class:`RateLimiter`，:meth:`acquire` 为协程
+    """
+
+    async def acquire(self, dir_name=None):
+        while True:
+            wait = self._try_acquire(dir_name)
+            if not wait:
+                return
+            await asyncio.sleep(wait)
@@ -0,0 +1,128 @@
+import asyncio
+import random
+import threading
+import time
+from collections import namedtuple
+
+import aiohttp
+import requests
+from urllib3.exceptions import NewConnectionError
+
+
+OpTimeout = namedtuple('OpTimeout', ['connect', 'read', 'deadline'])
+
+# 各类操作的连接超时、读超时和整个调用（含重试）的截止时间，单位为秒
+DEFAULT_TIMEOUTS = {
+    'read': OpTimeout(3.05, 10, 30),
+    'write': OpTimeout(3.05, 30, 60),
+    'upload': OpTimeout(3.05, 120, 600),
+    'download': OpTimeout(3.05, 60, None),
+}
+
+# 操作名: (操作类别, 是否幂等)
+OPERATIONS = {
+    'create_folder': ('write', False),
+    'list_folder': ('read', True),
+    'stat_folder': ('read', True),
+    'delete_folder': ('write', False),
+    'upload_file': ('upload', True),
+    'upload_slice_init': ('write', True),
+    'upload_slice_data': ('upload', True),
+    'upload_slice_finish': ('write', False),
+    'get_file': ('download', True),
+    'move_file': ('write', False),
+    'copy_file': ('write', False),
+    'delete_file': ('write', False),
+    'stat_file': ('read', True),
+    'update_file_status': ('write', True),
+}
+
+BACKOFF_BASE = 0.1
+BACKOFF_CAP = 5
+BUDGET_RATIO = 0.1
+BUDGET_MIN_PER_SECOND = 10
+
+
+def backoff(attempt, base=BACKOFF_BASE, cap=BACKOFF_CAP):
+    """
+    带完全随机抖动的指数退避 (full jitter)
+
+    :param attempt: 第几次重试，从 0 开始
+    """
+    return random.uniform(0, min(cap, base * 2 ** attempt))
+
+
+def merge_timeouts(timeouts):
+    merged = dict(DEFAULT_TIMEOUTS)
+    merged.update(timeouts or {})
+    return merged
+
+
+class RetryBudget(object):
+    """
+    重试预算，限制重试请求占全部请求的比例
+
+    每个请求存入 ``ratio`` 个令牌，每次重试取出一个令牌，
+    另外每秒固定补充 ``min_per_second`` 个令牌，保证低流量时也能重试。
+    故障期间预算耗尽后不再重试，避免重试放大负载
+
+    :param ratio: 重试请求与正常请求的比例，默认为 0.1
+    :param min_per_second: 每秒至少允许的重试次数，默认为 10
+    """
+
+    def __init__(self, ratio=BUDGET_RATIO, min_per_second=BUDGET_MIN_PER_SECOND):
+        self.ratio = ratio
+        self.min_per_second = min_per_second
+        self.max_tokens = max(min_per_second, 1) * 10
+        self._tokens = self.max_tokens
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self, extra=0):
+        now = time.monotonic()
+        self._tokens = min(
+            self.max_tokens,
+            self._tokens + extra +
+            (now - self._updated) * self.min_per_second
+        )
+        self._updated = now
+
+    def deposit(self):
+        with self._lock:
+            self._refill(self.ratio)
+
+    def withdraw(self):
+        """
+        :return: 是否允许重试
+        """
+        with self._lock:
+            self._refill()
+            if self._tokens < 1:
+                return False
+            self._tokens -= 1
+            return True
+
+
+# 进程内所有客户端默认共用同一个重试预算
+DEFAULT_RETRY_BUDGET = RetryBudget()
+
+
+def is_retryable(error, idempotent):
+    """
+    判断请求失败后能否安全重试
+
+    连接没有建立时请求一定没有发出，总是可以重试；
+    其他网络错误、超时和无法解析的响应，只有幂等操作才重试
+    """
+    if isinstance(error, requests.ConnectTimeout):
+        return True
+    if isinstance(error, requests.ConnectionError):
+        reason = getattr(error.args[0], 'reason', None) if error.args else None
+        if isinstance(reason, NewConnectionError):
+            return True
+    if isinstance(error, aiohttp.ClientConnectorError):
+        return True
+    if isinstance(error, (requests.RequestException, aiohttp.ClientError,
+                          asyncio.TimeoutError, ValueError)):
+        return idempotent
+    return False
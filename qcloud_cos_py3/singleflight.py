@@ -0,0 +1,83 @@
+import asyncio
+import threading
+
+from .cache import normalize_path
+
+
+class _Call(object):
+
+    def __init__(self):
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """
+    合并相同的并发读请求：同一个键同时只有一个请求在进行，
+    其他调用等待并共享它的结果或异常
+
+    键为 ``(操作名, 路径)``，对某路径的写操作完成后调用 :meth:`forget`，
+    之后的读请求不会再复用写操作之前发出的请求
+    """
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def do(self, op, path, fetch):
+        key = (op, normalize_path(path))
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.event.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fetch()
+            return call.result
+        except BaseException as e:
+            call.error = e
+            raise
+        finally:
+            self._done(key, call)
+            call.event.set()
+
+    def _done(self, key, call):
+        with self._lock:
+            if self._calls.get(key) is call:
+                del self._calls[key]
+
+    def forget(self, path):
+        path = normalize_path(path)
+        with self._lock:
+            for key in [k for k in self._calls if k[1] == path]:
+                del self._calls[key]
+
+    def __len__(self):
+        return len(self._calls)
+
+
+class AsyncSingleFlight(SingleFlight):
+    """
+    asyncio 版本的 :class:`SingleFlight`，fetch 为返回协程的函数。
+    请求在独立的 task 中进行，个别调用被取消不影响其他等待者
+    """
+
+    async def do(self, op, path, fetch):
+        key = (op, normalize_path(path))
+        task = self._calls.get(key)
+        if task is None:
+            task = self._calls[key] = asyncio.ensure_future(fetch())
+            task.add_done_callback(lambda t: self._finish(key, t))
+        return await asyncio.shield(task)
+
+    def _finish(self, key, task):
+        self._done(key, task)
+        # 所有等待者都被取消时，避免出现异常未被获取的警告
+        if not task.cancelled():
+            task.exception()
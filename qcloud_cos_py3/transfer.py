@@ -0,0 +1,90 @@
+import threading
+from collections import namedtuple
+
+
+# COS 分片上传允许的分片大小
+SLICE_SIZES = (524288, 1048576, 2097152, 3145728)
+
+TransferConfig = namedtuple(
+    'TransferConfig',
+    ['simple_threshold', 'parallel_threshold', 'max_workers', 'slice_size',
+     'slice_time', 'max_request_time']
+)
+TransferConfig.__doc__ = """
+:meth:`~qcloud_cos_py3.cos.CosBucket.put` 选择上传方式的阈值
+
+:param simple_threshold: 不超过此大小的文件使用简单上传，默认为 20 MB
+:param parallel_threshold: 不小于此大小的文件并行上传分片，默认为 64 MB
+:param max_workers: 并行上传分片的最大线程数，默认为 4
+:param slice_size: 固定的分片大小，默认为 None，即根据测得的上传速度选择
+:param slice_time: 自动选择分片大小时，单个分片的目标上传时间，默认为 2 秒
+:param max_request_time: 按测得的速度估计简单上传超过此时间时改用分片上传，
+  失败后不必从头重传，默认为 30 秒
+"""
+TransferConfig.__new__.__defaults__ = (
+    20 * 1024 * 1024, 64 * 1024 * 1024, 4, None, 2, 30
+)
+
+TransferPlan = namedtuple('TransferPlan', ['method', 'slice_size', 'max_workers'])
+
+# 小于此大小的上传主要受延迟影响，不用于估计速度
+THROUGHPUT_MIN_BYTES = 256 * 1024
+THROUGHPUT_ALPHA = 0.3
+
+
+class ThroughputTracker(object):
+    """
+    用指数加权移动平均估计单个连接的上传速度，单位为 Byte/s
+
+    :param alpha: 新样本的权重
+    """
+
+    def __init__(self, alpha=THROUGHPUT_ALPHA):
+        self.alpha = alpha
+        self.value = None
+        self._lock = threading.Lock()
+
+    def record(self, size, elapsed, connections=1):
+        if size < THROUGHPUT_MIN_BYTES or elapsed <= 0:
+            return
+        sample = size / elapsed / connections
+        with self._lock:
+            if self.value is None:
+                self.value = sample
+            else:
+                self.value += self.alpha * (sample - self.value)
+
+
+def choose_slice_size(config, throughput):
+    """
+    选择单个分片上传时间不超过 ``config.slice_time`` 的最大分片，
+    还没有测得速度时使用 1 MB
+    """
+    if config.slice_size:
+        return config.slice_size
+    if throughput is None:
+        return SLICE_SIZES[1]
+    fits = [s for s in SLICE_SIZES if s <= throughput * config.slice_time]
+    return fits[-1] if fits else SLICE_SIZES[0]
+
+
+def plan_transfer(size, config, throughput=None):
+    """
+    根据文件大小和测得的上传速度选择上传方式
+
+    :param size: 文件大小，未知时为 None
+    :param config: :class:`TransferConfig`
+    :param throughput: 单个连接的上传速度（可选），单位为 Byte/s
+    :return: ``TransferPlan(method, slice_size, max_workers)``，
+      method 为 ``'simple'``、``'slice'`` 或 ``'parallel'``
+    """
+    if size is not None and size <= config.simple_threshold and (
+            throughput is None or
+            size / throughput <= config.max_request_time):
+        return TransferPlan('simple', None, 1)
+    slice_size = choose_slice_size(config, throughput)
+    if size is not None and size >= config.parallel_threshold and \
+            config.max_workers > 1 and size > slice_size:
+        workers = min(config.max_workers, -(-size // slice_size))
+        return TransferPlan('parallel', slice_size, workers)
+    return TransferPlan('slice', slice_size, 1)
@@ -1,15 +1,76 @@
 import asyncio
+import hashlib
+import os
+import socket
 import tempfile
+import threading
+import time
 import unittest
-from qcloud_cos_py3 import CosBucket
-import tests.config as conf
+from unittest import mock
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from qcloud_cos_py3 import (
+    CosBucket, AsyncCosBucket, RateLimiter, Observer, MetricsAggregator,
+    TransferConfig, SliceCheckpoint, MultipartEncoder
+)
+from qcloud_cos_py3.retry import OpTimeout, RetryBudget, backoff
+from qcloud_cos_py3.hedge import LatencyTracker
+from qcloud_cos_py3.cache import MetaCache
+from qcloud_cos_py3.transfer import plan_transfer
+from qcloud_cos_py3.local_server import LocalCosServer
+from qcloud_cos_py3 import cos as cos_module
 from io import BytesIO
 
+try:
+    import tests.config as conf
+    LOCAL = False
+    ENDPOINT = getattr(conf, 'QCLOUD_ENDPOINT', None)
+except ImportError:
+    # 没有 tests/config.py 时在本地模拟服务上运行
+    class conf:
+        QCLOUD_APP_ID = '1250000000'
+        QCLOUD_SECRET_ID = 'local-secret-id'
+        QCLOUD_SECRET_KEY = 'local-secret-key'
+        QCLOUD_BUCKET = 'local'
+
+    LOCAL = True
+    server = LocalCosServer(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                            conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET)
+    server.start()
+    ENDPOINT = server.endpoint
+
+
+
+class SourceHandler(BaseHTTPRequestHandler):
+    # 抓取上传测试用的源站，/<名称>?nolength 不返回 Content-Length，
+    # /short 声明的长度比实际内容长
+    files = {}
+
+    def do_GET(self):
+        name, _, query = self.path[1:].partition('?')
+        content = self.files.get(name)
+        if content is None:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        if name == 'short':
+            self.send_header('Content-Length', str(len(content) * 2))
+        elif query != 'nolength':
+            self.send_header('Content-Length', str(len(content)))
+        self.end_headers()
+        self.wfile.write(content)
+
+    def log_message(self, *args):
+        pass
+
+
 cos = CosBucket(
     conf.QCLOUD_APP_ID,
     conf.QCLOUD_SECRET_ID,
     conf.QCLOUD_SECRET_KEY,
-    conf.QCLOUD_BUCKET
+    conf.QCLOUD_BUCKET,
+    endpoint=ENDPOINT
 )
 
 
@@ -59,6 +120,11 @@ class TestCos(unittest.TestCase):
         res = self.cos.list_folder('/cos_test', context=context, num=1)
         assert len(res['data']['infos']) == 1
 
+        # 自动翻页遍历目录
+        names = {info['name'] for info in
+                 self.cos.iter_folder('/cos_test', page_size=2)}
+        assert names == {'1.txt', '2.txt'}
+
         # 文件移动
         res = self.cos.move_file('/cos_test/2.txt', '/cos_test/3.txt')
         assert res['code'] == 0
@@ -75,6 +141,29 @@ class TestCos(unittest.TestCase):
         content = self.cos.get_file('/cos_test/3.txt')
         assert len(content)
 
+        # 流式下载文件
+        chunks = list(self.cos.iter_file('/cos_test/3.txt', chunk_size=4))
+        assert b''.join(chunks) == content
+        with tempfile.TemporaryDirectory() as tmp_dir:
+            local_path = os.path.join(tmp_dir, '3.txt')
+            size = self.cos.download_to_file('/cos_test/3.txt', local_path)
+            assert size == len(content)
+            with open(local_path, 'rb') as f:
+                assert f.read() == content
+            # 权限与直接创建的文件相同，不留下临时文件
+            plain_path = os.path.join(tmp_dir, 'plain.txt')
+            open(plain_path, 'w').close()
+            assert os.stat(local_path).st_mode == os.stat(plain_path).st_mode
+            os.remove(plain_path)
+            assert os.listdir(tmp_dir) == ['3.txt']
+
+            # 分段并行下载
+            size = self.cos.download_to_file('/cos_test/3.txt', local_path,
+                                             max_workers=3, part_size=3)
+            assert size == len(content)
+            with open(local_path, 'rb') as f:
+                assert f.read() == content
+
         # 获取文件信息
         res = self.cos.stat_file('/cos_test/3.txt')
         assert res['data']['custom_headers']['Content-Type'] == 'text/javascript'
@@ -89,6 +178,413 @@ class TestCos(unittest.TestCase):
         res = self.cos.delete_file('/cos_test/3.txt')
         assert res['code'] == 0
 
+    def test_connection_pool(self):
+        # 连接池复用，退出 with 时关闭
+        with CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                       conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                       endpoint=ENDPOINT,
+                       pool_size=2) as bucket:
+            for _ in range(3):
+                res = bucket.stat_folder('/cos_test')
+                assert res['code'] == 0
+
+    def test_sign_cache(self):
+        # 多次签名在有效期内复用，单次签名不缓存
+        signer = self.cos.signer
+        sign = signer.sign_more(conf.QCLOUD_BUCKET, '', 30)
+        assert signer.sign_more(conf.QCLOUD_BUCKET, '', 30) == sign
+        assert signer.sign_more(conf.QCLOUD_BUCKET, '/a', 30) != sign
+        assert not any(key[2] == 'once' for key in signer._cache)
+        res = self.cos.stat_folder('/cos_test')
+        assert res['code'] == 0
+
+    def test_meta_cache(self):
+        # 元数据缓存，写操作后自动失效
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT,
+                           meta_cache_size=10)
+        res = bucket.upload_file(BytesIO(b'cache'), '1.txt',
+                                 dir_name='cos_test')
+        assert res['code'] == 0
+        for _ in range(3):
+            res = bucket.stat_file('/cos_test/1.txt')
+            assert res['data']['filesize'] == 5
+        assert bucket.meta_cache.stats()['hits'] == 2
+
+        res = bucket.upload_file(BytesIO(b'cached'), '1.txt',
+                                 dir_name='cos_test')
+        assert res['code'] == 0
+        res = bucket.stat_file('/cos_test/1.txt')
+        assert res['data']['filesize'] == 6
+
+        res = bucket.delete_file('/cos_test/1.txt')
+        assert res['code'] == 0
+        res = bucket.stat_file('/cos_test/1.txt')
+        assert res['code'] != 0
+
+        # 读取期间路径或其下的文件被写过时，不缓存读到的旧结果
+        cache = MetaCache(10, 60)
+        file_key = ('file', 'cos_test/1.txt')
+        list_key = ('list', 'cos_test')
+        file_generation = cache.generation('cos_test/1.txt')
+        list_generation = cache.generation('cos_test')
+        cache.invalidate('/cos_test/1.txt')
+        cache.set(file_key, 'stale', file_generation)
+        cache.set(list_key, 'stale', list_generation)
+        assert cache.get(file_key) is None
+        assert cache.get(list_key) is None
+        cache.set(file_key, 'fresh', cache.generation('cos_test/1.txt'))
+        assert cache.get(file_key) == 'fresh'
+        # 写其他路径不影响
+        generation = cache.generation('cos_test/1.txt')
+        cache.invalidate('/other/2.txt')
+        cache.set(file_key, 'fresher', generation)
+        assert cache.get(file_key) == 'fresher'
+
+    def test_rate_limiter(self):
+        # 被限流时降速，成功后逐步回升
+        limiter = RateLimiter(max_rate=100, dir_max_rate=10, cooldown=0)
+        limiter.acquire('cos_test')
+        limiter.feedback(-143, 'cos_test')
+        assert limiter.rate('cos_test') == 5
+        assert limiter.rate('other') == 10
+        limiter.feedback(-71)
+        assert limiter.rate() == 50
+        limiter.feedback(0, 'cos_test')
+        assert limiter.rate('cos_test') == 7
+        assert limiter.rate() > 50
+
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT,
+                           rate_limiter=limiter)
+        res = bucket.stat_folder('/cos_test')
+        assert res['code'] == 0
+
+        # 同一轮限流只降一次速，降速后发出的请求仍被限流时继续降速
+        limiter = RateLimiter(max_rate=100, cooldown=10)
+        sent_at = time.monotonic()
+        limiter.feedback(-71, sent_at=sent_at)
+        limiter.feedback(-71, sent_at=sent_at)
+        assert limiter.rate() == 50
+        limiter.feedback(-71, sent_at=time.monotonic())
+        assert limiter.rate() == 25
+
+    @unittest.skipUnless(LOCAL, '需要本地模拟服务')
+    def test_throttle_backoff(self):
+        # 被限流时每次重试前都退避等待，超过限定时间后放弃
+        events = []
+        sleeps = []
+        real_sleep = time.sleep
+
+        class Recorder(Observer):
+            def on_request(self, event):
+                events.append(event)
+
+        def sleep(delay):
+            sleeps.append(delay)
+            real_sleep(delay)
+
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT, rate_limiter=False,
+                           observers=[Recorder()])
+        server.throttle_rate = 1
+        try:
+            count = server.request_count
+            start = time.monotonic()
+            with mock.patch.object(cos_module, 'MAX_THROTTLE_TIME', 1.5), \
+                    mock.patch('time.sleep', side_effect=sleep):
+                with self.assertRaises(Exception):
+                    bucket.stat_folder('/cos_test')
+            elapsed = time.monotonic() - start
+        finally:
+            server.throttle_rate = 0
+            bucket.close()
+        attempts = server.request_count - count
+        assert events[-1].throttles == attempts
+        assert len(sleeps) == attempts - 1
+        assert sleeps and all(delay > 0 for delay in sleeps)
+        assert elapsed >= sum(sleeps)
+        assert elapsed < 1.5 + 0.5
+
+    def test_retry_policy(self):
+        # 预算耗尽后不再重试，非幂等操作出错不重试
+        budget = RetryBudget(ratio=0, min_per_second=0)
+        budget._tokens = 0
+        assert not budget.withdraw()
+        for attempt in range(10):
+            assert 0 <= backoff(attempt) <= 5
+
+        events = []
+
+        class Recorder(Observer):
+            def on_request(self, event):
+                events.append(event)
+
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT,
+                           timeouts={'read': OpTimeout(3, 10, 20)},
+                           retry_budget=budget, observers=[Recorder()])
+        res = bucket.stat_folder('/cos_test')
+        assert res['code'] == 0
+
+        # 连接被拒绝可以重试，但预算为空，第一次失败后就放弃，不等待
+        with socket.socket() as sock:
+            sock.bind(('127.0.0.1', 0))
+            port = sock.getsockname()[1]
+        bucket.endpoint = 'http://127.0.0.1:%d' % port
+        with mock.patch('time.sleep') as sleep:
+            with self.assertRaises(Exception):
+                bucket.delete_file('cos_test/nope')
+        assert not sleep.called
+        assert events[-1].op == 'delete_file'
+        assert events[-1].retries == 0
+
+        # 预算充足时重试到 MAX_RETRY 次请求为止
+        bucket.retry_budget = RetryBudget()
+        with mock.patch('time.sleep') as sleep:
+            with self.assertRaises(Exception):
+                bucket.delete_file('cos_test/nope')
+        assert sleep.call_count == cos_module.MAX_RETRY - 1
+        assert events[-1].retries == cos_module.MAX_RETRY - 1
+        bucket.close()
+
+    def test_hedged_reads(self):
+        # 读请求超时未返回时发出对冲请求，取最先返回的结果
+        tracker = LatencyTracker(min_samples=10)
+        assert tracker.delay('stat_file') is None
+        for i in range(100):
+            tracker.record('stat_file', i / 100)
+        assert tracker.delay('stat_file') == 0.95
+
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT,
+                           hedge_delay=0.001, max_hedges=2)
+        res = bucket.upload_file(BytesIO(b'hedge'), '1.txt',
+                                 dir_name='cos_test')
+        assert res['code'] == 0
+        if LOCAL:
+            # 每个请求都慢于等待时间，应发出全部对冲请求。
+            # 写请求不对冲，此前没有未完成的请求
+            server.tail_latency = 0.05
+            server.tail_rate = 1
+            try:
+                count = server.request_count
+                res = bucket.stat_file('/cos_test/1.txt')
+                assert res['data']['filesize'] == 5
+                assert server.request_count - count == 3
+            finally:
+                server.tail_rate = 0
+                server.tail_latency = 0
+
+            # 只有第一个请求慢时，取最先返回的对冲请求的结果
+            server.tail_latency = 1
+            server.slow_next = 1
+            try:
+                start = time.monotonic()
+                res = bucket.stat_file('/cos_test/1.txt')
+                assert res['data']['filesize'] == 5
+                assert time.monotonic() - start < 0.5
+            finally:
+                server.slow_next = 0
+                server.tail_latency = 0
+
+            async def run():
+                async with AsyncCosBucket(
+                    conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                    conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                    endpoint=ENDPOINT, hedge_delay=0.05
+                ) as async_bucket:
+                    start = time.monotonic()
+                    res = await async_bucket.stat_file('/cos_test/1.txt')
+                    assert res['data']['filesize'] == 5
+                    assert time.monotonic() - start < 0.5
+                    content = await async_bucket.get_file('/cos_test/1.txt')
+                    assert content == b'hedge'
+
+            server.tail_latency = 1
+            server.slow_next = 1
+            try:
+                asyncio.run(run())
+            finally:
+                server.slow_next = 0
+                server.tail_latency = 0
+        assert bucket.get_file('/cos_test/1.txt') == b'hedge'
+        res = bucket.stat_file('/cos_test/1.txt')
+        assert res['data']['filesize'] == 5
+        res = bucket.list_folder('/cos_test')
+        assert len(res['data']['infos']) == 1
+        res = bucket.delete_file('/cos_test/1.txt')
+        assert res['code'] == 0
+        bucket.close()
+
+    @unittest.skipUnless(LOCAL, '需要本地模拟服务')
+    def test_download_without_range(self):
+        # 服务端忽略 Range 头时改为单个流下载，不重试
+        content = b'1234567890' * 100
+        res = cos.upload_file(BytesIO(content), '1.txt', dir_name='cos_test')
+        assert res['code'] == 0
+
+        async def run(local_path):
+            async with AsyncCosBucket(
+                conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                endpoint=ENDPOINT
+            ) as bucket:
+                return await bucket.download_to_file(
+                    '/cos_test/1.txt', local_path, max_workers=3,
+                    part_size=300
+                )
+
+        server.range_requests = False
+        try:
+            with tempfile.TemporaryDirectory() as tmp_dir:
+                local_path = os.path.join(tmp_dir, '1.txt')
+                count = server.request_count
+                size = cos.download_to_file('/cos_test/1.txt', local_path,
+                                            max_workers=3, part_size=300)
+                assert size == len(content)
+                with open(local_path, 'rb') as f:
+                    assert f.read() == content
+                # stat_file、4 个分段和 1 个完整下载
+                assert server.request_count - count == 6
+
+                os.remove(local_path)
+                count = server.request_count
+                assert asyncio.run(run(local_path)) == len(content)
+                with open(local_path, 'rb') as f:
+                    assert f.read() == content
+                assert server.request_count - count == 6
+        finally:
+            server.range_requests = True
+        res = cos.delete_file('/cos_test/1.txt')
+        assert res['code'] == 0
+
+    def test_single_flight(self):
+        # 相同的并发读请求只发出一个
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT,
+                           single_flight=True)
+        res = bucket.upload_file(BytesIO(b'flight'), '1.txt',
+                                 dir_name='cos_test')
+        assert res['code'] == 0
+        if LOCAL:
+            # 放慢服务端，让并发的调用互相重叠
+            server.latency = 0.2
+        try:
+            with ThreadPoolExecutor(max_workers=10) as executor:
+                count = server.request_count if LOCAL else 0
+                contents = list(executor.map(
+                    lambda _: bucket.get_file('/cos_test/1.txt'), range(10)
+                ))
+                if LOCAL:
+                    assert server.request_count - count == 1
+                    count = server.request_count
+                sizes = list(executor.map(
+                    lambda _: bucket.stat_file('/cos_test/1.txt'), range(10)
+                ))
+                if LOCAL:
+                    assert server.request_count - count == 1
+        finally:
+            if LOCAL:
+                server.latency = 0
+        assert set(contents) == {b'flight'}
+        assert {r['data']['filesize'] for r in sizes} == {6}
+        assert len(bucket.flights) == 0
+
+        # asyncio 版本
+        async def run():
+            async with AsyncCosBucket(
+                conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                endpoint=ENDPOINT, single_flight=True
+            ) as async_bucket:
+                count = server.request_count if LOCAL else 0
+                contents = await asyncio.gather(*[
+                    async_bucket.get_file('/cos_test/1.txt')
+                    for _ in range(10)
+                ])
+                if LOCAL:
+                    assert server.request_count - count == 1
+                    count = server.request_count
+                sizes = await asyncio.gather(*[
+                    async_bucket.stat_file('/cos_test/1.txt')
+                    for _ in range(10)
+                ])
+                if LOCAL:
+                    assert server.request_count - count == 1
+                assert set(contents) == {b'flight'}
+                assert {r['data']['filesize'] for r in sizes} == {6}
+                assert len(async_bucket.flights) == 0
+
+        if LOCAL:
+            server.latency = 0.2
+        try:
+            asyncio.run(run())
+        finally:
+            if LOCAL:
+                server.latency = 0
+
+        res = bucket.upload_file(BytesIO(b'landed'), '1.txt',
+                                 dir_name='cos_test')
+        assert res['code'] == 0
+        assert bucket.get_file('/cos_test/1.txt') == b'landed'
+        res = bucket.delete_file('/cos_test/1.txt')
+        assert res['code'] == 0
+
+    def test_metrics(self):
+        # 每次 API 调用结束时通知观察者
+        events = []
+
+        class Recorder(Observer):
+            def on_request(self, event):
+                events.append(event)
+
+        aggregator = MetricsAggregator()
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT,
+                           observers=[aggregator, Recorder()])
+        res = bucket.upload_file(BytesIO(b'metrics'), '1.txt',
+                                 dir_name='cos_test')
+        assert res['code'] == 0
+        assert bucket.get_file('/cos_test/1.txt') == b'metrics'
+        res = bucket.delete_file('/cos_test/1.txt')
+        assert res['code'] == 0
+
+        assert [e.op for e in events] == ['upload_file', 'get_file',
+                                          'delete_file']
+        assert events[0].code == 0 and events[0].bytes_sent > 7
+        assert events[1].bytes_received == 7
+        assert all(e.latency >= e.ttfb > 0 for e in events)
+        stats = aggregator.snapshot()
+        assert stats['upload_file']['latency']['count'] == 1
+        assert stats['delete_file']['codes'] == {0: 1}
+        assert aggregator.percentile('get_file', 99) is not None
+
+    @unittest.skipUnless(LOCAL, '只在本地模拟服务上运行')
+    def test_local_server(self):
+        # 模拟服务校验签名，并可以注入错误
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           'wrong-secret-key', conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT)
+        res = bucket.stat_folder('/cos_test')
+        assert res['code'] == -133
+
+        server.error_rate = 1
+        try:
+            with self.assertRaises(Exception):
+                self.cos.stat_folder('/cos_test')
+        finally:
+            server.error_rate = 0
+        res = self.cos.stat_folder('/cos_test')
+        assert res['code'] == 0
+
     def test_async_upload(self):
         # 异步并行上传
         async def async_upload(file_stream, file_name):
@@ -107,6 +603,128 @@ class TestCos(unittest.TestCase):
             res = self.cos.delete_file('cos_test/{}'.format(i))
             assert res['code'] == 0
 
+    def test_async_bucket(self):
+        # 共用一个 session 的异步客户端
+        async def run():
+            async with AsyncCosBucket(
+                conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET, limit=2,
+                endpoint=ENDPOINT
+            ) as bucket:
+                rs = await asyncio.gather(*[
+                    bucket.upload_file(BytesIO(b'Yo yo'), str(i),
+                                       dir_name='/cos_test')
+                    for i in range(3)
+                ])
+                assert all(r['code'] == 0 for r in rs)
+                res = await bucket.list_folder('/cos_test')
+                assert len(res['data']['infos']) == 3
+                content = await bucket.get_file('/cos_test/0')
+                assert content == b'Yo yo'
+                for i in range(3):
+                    res = await bucket.delete_file('cos_test/{}'.format(i))
+                    assert res['code'] == 0
+
+        asyncio.get_event_loop().run_until_complete(run())
+
+    def test_walk(self):
+        # 并行递归遍历目录树
+        for path in ('a/1.txt', 'a/b/2.txt', 'c/3.txt'):
+            res = self.cos.upload_file(BytesIO(b'walk'), path,
+                                       dir_name='cos_test')
+            assert res['code'] == 0
+
+        tree = {dir_path: {info['name'] for info in file_infos}
+                for dir_path, _, file_infos in self.cos.walk('/cos_test')}
+        assert tree == {
+            'cos_test': set(),
+            'cos_test/a': {'1.txt'},
+            'cos_test/a/b': {'2.txt'},
+            'cos_test/c': {'3.txt'},
+        }
+        dirs = {d for d, _, _ in self.cos.walk('/cos_test', max_depth=1)}
+        assert dirs == {'cos_test', 'cos_test/a', 'cos_test/c'}
+
+        for path in ('a/1.txt', 'a/b/2.txt', 'c/3.txt'):
+            res = self.cos.delete_file('cos_test/' + path)
+            assert res['code'] == 0
+
+    def test_batch_operations(self):
+        # 批量拷贝、移动、删除
+        for i in range(3):
+            res = self.cos.upload_file(BytesIO(b'batch'), '%d.txt' % i,
+                                       dir_name='cos_test')
+            assert res['code'] == 0
+
+        rs = self.cos.copy_many(
+            [('/cos_test/%d.txt' % i, 'copy_%d.txt' % i) for i in range(3)],
+            max_workers=3
+        )
+        assert all(r.ok for r in rs)
+        rs = self.cos.move_many(
+            [('/cos_test/copy_%d.txt' % i, 'move_%d.txt' % i)
+             for i in range(3)]
+        )
+        assert all(r.ok for r in rs)
+
+        paths = ['cos_test/%d.txt' % i for i in range(3)] + \
+                ['cos_test/move_%d.txt' % i for i in range(3)] + \
+                ['cos_test/not_exist.txt']
+        rs = self.cos.delete_many(paths)
+        assert [r.item for r in rs] == paths
+        assert all(r.ok for r in rs[:-1])
+        assert not rs[-1].ok and rs[-1].code != 0
+
+    def test_sync_dir(self):
+        # 增量同步本地目录
+        with tempfile.TemporaryDirectory() as local_root:
+            os.makedirs(os.path.join(local_root, 'sub'))
+            for name, content in (('1.txt', b'one'), ('sub/2.txt', b'two')):
+                with open(os.path.join(local_root, name), 'wb') as f:
+                    f.write(content)
+
+            report = self.cos.sync_dir(local_root, '/cos_test')
+            assert report['upload'] == ['1.txt', 'sub/2.txt']
+            assert not report['errors']
+
+            with open(os.path.join(local_root, 'sub/2.txt'), 'wb') as f:
+                f.write(b'TWO')
+            os.remove(os.path.join(local_root, '1.txt'))
+            report = self.cos.sync_dir(local_root, '/cos_test', dry_run=True,
+                                       delete=True)
+            assert report['upload'] == ['sub/2.txt']
+            assert report['delete'] == ['1.txt']
+
+            report = self.cos.sync_dir(local_root, '/cos_test', delete=True)
+            assert not report['errors']
+            res = self.cos.list_folder('/cos_test')
+            assert [i['name'] for i in res['data']['infos']] == ['sub']
+            report = self.cos.sync_dir(local_root, '/cos_test')
+            assert report['unchanged'] == ['sub/2.txt']
+
+            if LOCAL:
+                # 列表中 sha 为 null 时视为有变化，而不是出错
+                file_info = server._file_info
+
+                def no_sha(path):
+                    return dict(file_info(path), sha=None)
+
+                with mock.patch.object(server, '_file_info', no_sha):
+                    report = self.cos.sync_dir(local_root, '/cos_test',
+                                               dry_run=True)
+                assert report['upload'] == ['sub/2.txt']
+                assert not report['errors']
+
+            # 本地目录不存在时不能把远端文件当作已删除
+            with self.assertRaises(ValueError):
+                self.cos.sync_dir(os.path.join(local_root, 'typo'),
+                                  '/cos_test', delete=True)
+            res = self.cos.stat_file('/cos_test/sub/2.txt')
+            assert res['code'] == 0
+
+        res = self.cos.delete_file('cos_test/sub/2.txt')
+        assert res['code'] == 0
+
     def test_sliced_upload(self):
         # 分片上传
         fp = tempfile.NamedTemporaryFile()
@@ -119,6 +737,300 @@ class TestCos(unittest.TestCase):
         res = cos.delete_file('cos_test/slice.txt')
         assert res['code'] == 0
 
+    def test_sliced_upload_sha(self):
+        # 分片上传时计算 SHA1 并校验
+        content = os.urandom(1500000)
+        sha = hashlib.sha1(content).hexdigest()
+        fp = tempfile.NamedTemporaryFile()
+        fp.write(content)
+        fp.flush()
+        for max_workers in (1, 2):
+            res = cos.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                        dir_name='/cos_test', sha=sha,
+                                        verify=True, max_workers=max_workers)
+            assert res['resource_path'].endswith('/cos_test/slice.txt')
+        if LOCAL:
+            with self.assertRaises(Exception):
+                cos.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                      dir_name='/cos_test', sha='0' * 40)
+
+        async def run():
+            async with AsyncCosBucket(
+                conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                endpoint=ENDPOINT
+            ) as bucket:
+                await bucket.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                               dir_name='/cos_test',
+                                               sha=sha, verify=True)
+
+        asyncio.run(run())
+        assert cos.get_file('cos_test/slice.txt') == content
+        # COS 返回的 SHA1 可能是大写
+        cos._check_sha('/cos_test/slice.txt', sha,
+                       {'code': 0, 'data': {'sha': sha.upper()}})
+        with self.assertRaises(Exception):
+            cos._check_sha('/cos_test/slice.txt', sha,
+                           {'code': 0, 'data': {'sha': '0' * 40}})
+        res = cos.delete_file('cos_test/slice.txt')
+        assert res['code'] == 0
+
+    def test_if_changed(self):
+        # 内容相同时跳过上传，返回已有文件的信息
+        res = cos.upload_file(BytesIO(b'Yo come on'), '1.txt',
+                              dir_name='cos_test', if_changed=True)
+        assert 'sha' not in res['data']
+        res = cos.upload_file(BytesIO(b'Yo come on'), '1.txt',
+                              dir_name='cos_test', if_changed=True)
+        assert res['data']['sha'] == hashlib.sha1(b'Yo come on').hexdigest()
+        res = cos.upload_file(b'Yo come ON', '1.txt', dir_name='cos_test',
+                              if_changed=True)
+        assert 'sha' not in res['data']
+        assert cos.get_file('cos_test/1.txt') == b'Yo come ON'
+
+        fp = tempfile.NamedTemporaryFile()
+        fp.write(b'1234567890' * 150000)
+        fp.flush()
+        res = cos.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                    dir_name='cos_test', if_changed=True)
+        assert 'sha' not in res
+
+        async def run():
+            async with AsyncCosBucket(
+                conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                endpoint=ENDPOINT
+            ) as bucket:
+                res = await bucket.upload_slice_file(
+                    fp.name, 524288, 'slice.txt', dir_name='cos_test',
+                    if_changed=True
+                )
+                assert res['sha']
+                res = await bucket.upload_file(
+                    b'Yo come ON', '1.txt', dir_name='cos_test',
+                    if_changed=True
+                )
+                assert res['data']['sha']
+
+        asyncio.run(run())
+        # 无法 seek 的流不能先计算 SHA1
+        with self.assertRaises(ValueError):
+            cos.upload_file(iter([b'Yo']), '1.txt', if_changed=True)
+        for name in ('1.txt', 'slice.txt'):
+            res = cos.delete_file('cos_test/' + name)
+            assert res['code'] == 0
+
+    def test_thread_safety(self):
+        # 多个线程共用一个 CosBucket 同时分片上传不同的文件
+        contents = [os.urandom(600000 + i) for i in range(8)]
+        files = []
+        for content in contents:
+            fp = tempfile.NamedTemporaryFile()
+            fp.write(content)
+            fp.flush()
+            files.append(fp)
+
+        def upload(i):
+            res = bucket.upload_slice_file(files[i].name, 524288,
+                                           '%d.bin' % i, dir_name='cos_test')
+            assert res['resource_path'].endswith('/cos_test/%d.bin' % i)
+            return bucket.get_file('cos_test/%d.bin' % i)
+
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT, pool_size=len(contents))
+        with bucket, ThreadPoolExecutor(max_workers=len(contents)) as executor:
+            assert list(executor.map(upload, range(len(contents)))) == \
+                contents
+            for i in range(len(contents)):
+                res = bucket.delete_file('cos_test/%d.bin' % i)
+                assert res['code'] == 0
+
+    def test_parallel_sliced_upload(self):
+        # 多线程并行分片上传
+        fp = tempfile.NamedTemporaryFile()
+        fp.write(b'1234567890' * 150000)
+        fp.seek(0)
+        progress = []
+        res = cos.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                    dir_name='/cos_test', max_workers=3,
+                                    progress=lambda n, total: progress.append(n))
+        assert res['resource_path'].endswith('/cos_test/slice.txt')
+        assert progress[-1] == 1500000
+        res = cos.stat_file('/cos_test/slice.txt')
+        assert res['data']['filesize'] == 1500000
+        res = cos.delete_file('cos_test/slice.txt')
+        assert res['code'] == 0
+
+    def test_resumed_sliced_upload(self):
+        # 断点续传
+        fp = tempfile.NamedTemporaryFile()
+        fp.write(b'1234567890' * 150000)
+        fp.seek(0)
+        checkpoint = fp.name + '.checkpoint'
+
+        def crash(uploaded, total):
+            raise KeyboardInterrupt
+
+        with self.assertRaises(KeyboardInterrupt):
+            cos.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                  dir_name='/cos_test', progress=crash,
+                                  checkpoint=checkpoint)
+        progress = []
+        res = cos.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                    dir_name='/cos_test', checkpoint=checkpoint,
+                                    progress=lambda n, total: progress.append(n))
+        assert res['resource_path'].endswith('/cos_test/slice.txt')
+        assert progress == [1048576, 1500000]
+        assert not os.path.exists(checkpoint)
+        res = cos.stat_file('/cos_test/slice.txt')
+        assert res['data']['filesize'] == 1500000
+        res = cos.delete_file('cos_test/slice.txt')
+        assert res['code'] == 0
+
+    def test_multipart_encoder(self):
+        # 请求体格式与 COS 接受的一致，boundary 不带引号
+        encoder = MultipartEncoder({'op': 'upload', 'insertOnly': 0},
+                                   b'0123456789', chunk_size=4)
+        boundary = encoder.boundary.encode('utf-8')
+        assert encoder.content_type == \
+            'multipart/form-data; boundary=' + encoder.boundary
+        body = (
+            b'--' + boundary + b'\r\n'
+            b'Content-Disposition: form-data; name="op"\r\n\r\n'
+            b'upload\r\n'
+            b'--' + boundary + b'\r\n'
+            b'Content-Disposition: form-data; name="insertOnly"\r\n\r\n'
+            b'0\r\n'
+            b'--' + boundary + b'\r\n'
+            b'Content-Disposition: form-data; name="filecontent"; '
+            b'filename=""\r\n'
+            b'Content-Type: application/octet-stream\r\n\r\n'
+            b'0123456789\r\n'
+            b'--' + boundary + b'--\r\n'
+        )
+        assert b''.join(encoder) == body
+        assert encoder.len == len(body)
+
+        # 只有表单字段
+        encoder = MultipartEncoder({'op': 'create'})
+        assert b''.join(encoder) == (
+            b'--' + encoder.boundary.encode('utf-8') + b'\r\n'
+            b'Content-Disposition: form-data; name="op"\r\n\r\n'
+            b'create\r\n'
+            b'--' + encoder.boundary.encode('utf-8') + b'--\r\n'
+        )
+
+        # 可以 seek 的流从当前位置计算长度，rewind 后重新读出相同内容
+        stream = BytesIO(b'xx0123456789')
+        stream.seek(2)
+        encoder = MultipartEncoder({'op': 'upload'}, stream, chunk_size=4)
+        assert encoder.rewindable
+        first = encoder.read()
+        assert len(first) == encoder.len
+        assert b'0123456789' in first and b'xx' not in first
+        assert encoder.read() == b''
+        encoder.rewind()
+        assert encoder.read() == first
+
+        # 一个块内的 read(n) 返回 memoryview，不复制内容
+        head = first.index(b'0123456789')
+        encoder.rewind()
+        part = encoder.read(head - 1)
+        assert isinstance(part, memoryview)
+        assert len(part) == head - 1
+        assert encoder.read(1) == first[head - 1:head]
+        assert bytes(encoder.read(4)) == b'0123'
+        # 跨越多个块时拼接成 bytes
+        assert encoder.read(8) == b'456789\r\n'
+
+        # 无法 seek 的流不能重发，未给出 size 时长度未知
+        class Unseekable(object):
+            def __init__(self, content):
+                self._content = BytesIO(content)
+
+            def read(self, size=-1):
+                return self._content.read(size)
+
+        encoder = MultipartEncoder({'op': 'upload'}, Unseekable(b'abc'))
+        assert not encoder.rewindable
+        assert encoder.len is None
+        encoder = MultipartEncoder({'op': 'upload'}, Unseekable(b'abc'),
+                                   size=3)
+        assert encoder.len == len(b''.join(encoder))
+
+    def test_slice_checkpoint(self):
+        # 断点记录只追加写入，读取时丢弃写了一半的行并合并
+        fp = tempfile.NamedTemporaryFile()
+        fp.write(b'1234567890')
+        fp.flush()
+        path = fp.name + '.checkpoint'
+        journal = SliceCheckpoint.load(path, '/url', fp.name, 524288)
+        assert journal.session is None
+        journal.session = 'session'
+        journal.serial_upload = True
+        journal.save()
+        journal.add(0)
+        journal.add(1048576)
+        journal.add(524288)
+        with open(path, 'a') as f:
+            f.write('157')
+        with open(path) as f:
+            assert len(f.read().splitlines()) == 5
+
+        journal = SliceCheckpoint.load(path, '/url', fp.name, 524288)
+        assert journal.session == 'session'
+        assert journal.serial_upload
+        assert journal.done == {0, 524288, 1048576}
+        with open(path) as f:
+            assert f.read().splitlines()[1:] == ['0', '524288', '1048576']
+        # 分片大小不同时记录失效
+        journal = SliceCheckpoint.load(path, '/url', fp.name, 1048576)
+        assert journal.session is None and not journal.done
+        journal.remove()
+        assert not os.path.exists(path)
+
+    @unittest.skipUnless(LOCAL, '需要本地模拟服务')
+    def test_resumed_serial_upload(self):
+        # 初始化时 COS 要求串行上传，续传时也不能并行
+        fp = tempfile.NamedTemporaryFile()
+        fp.write(b'1234567890' * 300000)
+        fp.flush()
+        checkpoint = fp.name + '.checkpoint'
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT)
+        upload_slice_data = bucket._upload_slice_data
+        threads = set()
+
+        def record(*args, **kwargs):
+            threads.add(threading.get_ident())
+            return upload_slice_data(*args, **kwargs)
+
+        def crash(uploaded, total):
+            raise KeyboardInterrupt
+
+        bucket._upload_slice_data = record
+        server.serial_upload = True
+        try:
+            with self.assertRaises(KeyboardInterrupt):
+                bucket.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                         dir_name='/cos_test', progress=crash,
+                                         checkpoint=checkpoint)
+            server.serial_upload = False
+            threads.clear()
+            res = bucket.upload_slice_file(fp.name, 524288, 'slice.txt',
+                                           dir_name='/cos_test', max_workers=4,
+                                           checkpoint=checkpoint)
+        finally:
+            server.serial_upload = False
+            bucket.close()
+        assert res['resource_path'].endswith('/cos_test/slice.txt')
+        assert threads == {threading.get_ident()}
+        res = cos.delete_file('cos_test/slice.txt')
+        assert res['code'] == 0
+
+    @unittest.skipIf(LOCAL, '需要访问外网')
     def test_fetch_and_upload(self):
         # 抓取并上传
         res = cos.upload_file_from_url(
@@ -133,3 +1045,119 @@ class TestCos(unittest.TestCase):
 
         res = cos.upload_file_from_url('http://a_url_not_exist', '1.txt')
         assert res['error']
+
+    def test_stream_from_url(self):
+        # 边下载边上传，大文件使用分片上传
+        source = ThreadingHTTPServer(('127.0.0.1', 0), SourceHandler)
+        threading.Thread(target=source.serve_forever, daemon=True).start()
+        base = 'http://127.0.0.1:%d/' % source.server_port
+        big = os.urandom(1500000)
+        SourceHandler.files.update(small=b'Yo come on', big=big,
+                                   short=b'12345')
+        kwargs = {'dir_name': 'cos_test', 'slice_threshold': 1048576,
+                  'slice_size': 524288}
+        try:
+            for name in ('small', 'big', 'big?nolength'):
+                res = cos.upload_file_from_url(base + name, '1.bin', **kwargs)
+                assert 'error' not in res
+                content = cos.get_file('cos_test/1.bin')
+                assert content == SourceHandler.files[name.split('?')[0]]
+
+            # 超过大小上限
+            res = cos.upload_file_from_url(base + 'big', '2.bin',
+                                           max_size=1000000, **kwargs)
+            assert res == {'error': 'file too large'}
+            res = cos.upload_file_from_url(base + 'big?nolength', '2.bin',
+                                           max_size=1000000, **kwargs)
+            assert res == {'error': 'file too large'}
+            # 源站内容不完整
+            res = cos.upload_file_from_url(base + 'short', '2.bin', **kwargs)
+            assert res == {'error': 'download file failed'}
+            res = cos.upload_file_from_url(base + 'none', '2.bin', **kwargs)
+            assert res == {'error': 'download file failed'}
+            assert cos.stat_file('cos_test/2.bin')['code'] != 0
+
+            async def run():
+                async with AsyncCosBucket(
+                    conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                    conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                    endpoint=ENDPOINT
+                ) as bucket:
+                    for name in ('small', 'big', 'big?nolength'):
+                        res = await bucket.upload_file_from_url(
+                            base + name, '3.bin', **kwargs
+                        )
+                        assert 'error' not in res
+                        content = await bucket.get_file('cos_test/3.bin')
+                        assert content == \
+                            SourceHandler.files[name.split('?')[0]]
+                    res = await bucket.upload_file_from_url(
+                        base + 'short', '4.bin', **kwargs
+                    )
+                    assert res == {'error': 'download file failed'}
+                    res = await bucket.upload_file_from_url(
+                        base + 'big', '4.bin', max_size=1000000, **kwargs
+                    )
+                    assert res == {'error': 'file too large'}
+
+            asyncio.run(run())
+        finally:
+            source.shutdown()
+            source.server_close()
+            for name in ('1.bin', '3.bin'):
+                cos.delete_file('cos_test/' + name)
+
+    def test_put(self):
+        # 根据大小和上传速度选择上传方式
+        config = TransferConfig(simple_threshold=1048576,
+                                parallel_threshold=2097152, max_workers=2)
+        MB = 1048576
+        assert plan_transfer(1000, config).method == 'simple'
+        assert plan_transfer(None, config).method == 'slice'
+        assert plan_transfer(MB + 1, config) == ('slice', MB, 1)
+        assert plan_transfer(8 * MB, config) == ('parallel', MB, 2)
+        # 速度快时用大分片，速度慢时小文件也分片上传
+        assert plan_transfer(8 * MB, config, 10 * MB).slice_size == 3 * MB
+        assert plan_transfer(MB, config, 10000) == ('slice', 524288, 1)
+
+        class Stream(object):
+            # 无法 seek 的流
+            def __init__(self, content):
+                self._stream = BytesIO(content)
+
+            def read(self, size=-1):
+                return self._stream.read(size)
+
+        content = os.urandom(2500000)
+        fp = tempfile.NamedTemporaryFile()
+        fp.write(content)
+        fp.flush()
+        sources = [b'Yo come on', fp.name, content, BytesIO(content),
+                   Stream(content), Stream(b'Yo come on')]
+        bucket = CosBucket(conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                           conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                           endpoint=ENDPOINT, transfer_config=config)
+        with bucket:
+            for source in sources:
+                res = bucket.put(source, '/cos_test/put.bin')
+                assert 'error' not in res
+                expected = source if isinstance(source, bytes) else content
+                if isinstance(source, Stream):
+                    expected = source._stream.getvalue()
+                assert bucket.get_file('cos_test/put.bin') == expected
+            assert bucket.throughput.value
+
+        async def run():
+            async with AsyncCosBucket(
+                conf.QCLOUD_APP_ID, conf.QCLOUD_SECRET_ID,
+                conf.QCLOUD_SECRET_KEY, conf.QCLOUD_BUCKET,
+                endpoint=ENDPOINT, transfer_config=config
+            ) as bucket:
+                for source in (fp.name, content, Stream(content)):
+                    res = await bucket.put(source, 'cos_test/put.bin')
+                    assert 'error' not in res
+                    assert await bucket.get_file('cos_test/put.bin') == content
+
+        asyncio.run(run())
+        res = cos.delete_file('cos_test/put.bin')
+        assert res['code'] == 0